@@ -1,9 +1,12 @@
 # 01_patient_cleaning.py
 
-import pandas as pd
 import numpy as np
-import gzip
 from pathlib import Path
+from store import write_table
+from loader import load_table
+from ingest import blocked_dir
+from temporal import age_years, parse_table
+from telemetry import step
 
 # Configuration
 data_dir = Path('data/original')
@@ -11,41 +14,41 @@ output_dir = Path('data/processed')
 output_dir.mkdir(exist_ok=True)
 VALID_AGE_RANGE = (0, 120)
 
-def load_gzipped_csv(path):
-    with gzip.open(path, 'rb') as f:
-        return pd.read_csv(f)
-
 def clean_patients_data(patients):
     patients.columns = patients.columns.str.lower()
     
-    # Date handling
-    patients['birthdate'] = pd.to_datetime(patients['birthdate'], errors='coerce')
-    patients['age'] = (pd.to_datetime('today') - patients['birthdate']).dt.days / 365.25
-    
-    # Age validation
-    patients['age'] = np.where(
-        (patients['age'] < VALID_AGE_RANGE[0]) | (patients['age'] > VALID_AGE_RANGE[1]),
-        np.nan,
-        patients['age']
-    )
-    
-    # Demographics cleaning
-    patients['gender'] = patients['gender'].map({'M': 'M', 'F': 'F', '8293.3': np.nan})
-    
-    # Simplified race cleaning (since data is already clean)
-    patients['race'] = patients['race'].str.lower()
-    valid_races = ['white', 'black', 'asian', 'hawaiian', 'other', 'native']
-    patients['race'] = patients['race'].where(
-        patients['race'].isin(valid_races),  # Keep if valid
-        'other'  # Replace invalid values
-    )
+    # Date handling: ages at the fixed reference date, so reruns give the same output
+    with step('type_coercion', len(patients)) as s:
+        patients = parse_table(patients, 'patients')
+        patients['age'] = age_years(patients['birthdate'])
+        s['rows_out'] = len(patients)
     
-    # Quality flags
-    patients['data_quality_flag'] = np.where(
-        patients[['birthdate', 'gender', 'age']].isna().any(axis=1),
-        'Invalid',
-        'Valid'
-    )
+    with step('validation', len(patients)) as s:
+        # Age validation
+        patients['age'] = np.where(
+            (patients['age'] < VALID_AGE_RANGE[0]) | (patients['age'] > VALID_AGE_RANGE[1]),
+            np.nan,
+            patients['age']
+        )
+        
+        # Demographics cleaning
+        patients['gender'] = patients['gender'].map({'M': 'M', 'F': 'F', '8293.3': np.nan})
+        
+        # Simplified race cleaning (since data is already clean)
+        patients['race'] = patients['race'].str.lower()
+        valid_races = ['white', 'black', 'asian', 'hawaiian', 'other', 'native']
+        patients['race'] = patients['race'].where(
+            patients['race'].isin(valid_races),  # Keep if valid
+            'other'  # Replace invalid values
+        )
+        
+        # Quality flags
+        patients['data_quality_flag'] = np.where(
+            patients[['birthdate', 'gender', 'age']].isna().any(axis=1),
+            'Invalid',
+            'Valid'
+        )
+        s['rows_out'] = int((patients['data_quality_flag'] == 'Valid').sum())
     
     return patients
 
@@ -71,23 +74,47 @@ def print_race_verification(patients, clean_patients):
                 ['white','black','asian','hawaiian','native'])]['race'].unique()
             print(f"Non-standard values mapped to 'other': {non_standard}")
 
+def split_and_save(clean_patients, output_dir=output_dir):
+    valid_patients = clean_patients[clean_patients['data_quality_flag'] == 'Valid']
+    invalid_patients = clean_patients[clean_patients['data_quality_flag'] == 'Invalid']
+    
+    with step('write', len(clean_patients)) as s:
+        written = [write_table(valid_patients, 'clean_patients', output_dir),
+                   write_table(invalid_patients, 'excluded_patients', output_dir)]
+        s.update(rows_out=len(valid_patients), bytes=sum(path.stat().st_size for path in written))
+    return valid_patients, invalid_patients
+
+def run_stage(data_dir=data_dir, output_dir=output_dir):
+    """Read the raw patients once, clean, split, save and return the report counts"""
+    with step('load') as s:
+        patients = load_table('patients', data_dir=data_dir, block_dir=blocked_dir(output_dir))
+        s['rows_out'] = len(patients)
+    initial = len(patients)
+    valid_patients, invalid_patients = split_and_save(clean_patients_data(patients), output_dir)
+    
+    return {
+        'initial': initial,
+        'valid': len(valid_patients),
+        'excluded': len(invalid_patients),
+    }
+
+def report(counts):
+    print("\n=== Final Cleaning Report ===")
+    print(f"Initial patients: {counts['initial']}")
+    print(f"Valid patients: {counts['valid']} ({counts['valid']/counts['initial']:.1%})")
+    print(f"Excluded patients: {counts['excluded']}")
+
 if __name__ == "__main__":
     # Load and clean
-    patients = load_gzipped_csv(data_dir / 'patients.csv.gz')
+    patients = load_table('patients', data_dir=data_dir)
+    initial = len(patients)
     clean_patients = clean_patients_data(patients)
     
     # Split and save
-    valid_patients = clean_patients[clean_patients['data_quality_flag'] == 'Valid']
-    invalid_patients = clean_patients[clean_patients['data_quality_flag'] == 'Invalid']
-    
-    valid_patients.to_csv(output_dir / 'clean_patients.csv', index=False)
-    invalid_patients.to_csv(output_dir / 'excluded_patients.csv', index=False)
+    valid_patients, invalid_patients = split_and_save(clean_patients)
     
     # Reporting
-    print("\n=== Final Cleaning Report ===")
-    print(f"Initial patients: {len(patients)}")
-    print(f"Valid patients: {len(valid_patients)} ({len(valid_patients)/len(patients):.1%})")
-    print(f"Excluded patients: {len(invalid_patients)}")
+    report({'initial': initial, 'valid': len(valid_patients), 'excluded': len(invalid_patients)})
     
     print("\nFinal age distribution (years):")
     print(valid_patients['age'].describe())
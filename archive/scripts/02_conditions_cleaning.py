@@ -1,41 +1,75 @@
 # 02_conditions_cleaning.py
 
-import pandas as pd
-import numpy as np
 from pathlib import Path
-import gzip
-from IPython.display import display, Markdown
+from store import write_table
+from loader import load_table
+from ingest import blocked_dir
+import terminology
+from temporal import parse_table
+from patient_index import linked, load_patient_index
+from telemetry import step
 
 DATA_DIR = Path('data/original')
 OUTPUT_DIR = Path('data/processed')
 
-def load_conditions(conditions_path, clean_patients_path):
-    """Load and validate conditions data"""
-    conditions = pd.read_csv(conditions_path)
-    valid_patients = pd.read_csv(clean_patients_path)['id']
-    
+def clean_conditions(conditions, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Validate an already loaded conditions frame against the valid-patient index and data_dir's SNOMED dictionary"""
     # QC Checks
-    conditions = conditions[conditions['PATIENT'].isin(valid_patients)]
-    conditions['START'] = pd.to_datetime(conditions['START'], errors='coerce')
+    with step('patient_filter', len(conditions)) as s:
+        conditions = conditions[linked(conditions['PATIENT'], valid_patients)].copy()
+        s['rows_out'] = len(conditions)
+    with step('type_coercion', len(conditions)) as s:
+        conditions = parse_table(conditions, 'conditions')
+        s['rows_out'] = len(conditions)
     
     # SNOMED Validation
-    snomed_codes = pd.read_csv(DATA_DIR/'dictionary_snomed.csv')['CODE']
-    valid_conditions = conditions[conditions['CODE'].isin(snomed_codes)]
+    with step('code_validation', len(conditions)) as s:
+        cache_dir = terminology.index_cache_dir(output_dir)
+        valid_conditions = conditions[terminology.is_valid('snomed', conditions['CODE'], data_dir, cache_dir)]
+        s['rows_out'] = len(valid_conditions)
     
     return valid_conditions
 
+def clean_block(raw, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Clean one block of raw conditions for incremental runs; counts are per block"""
+    conditions = clean_conditions(raw, valid_patients, data_dir, output_dir)
+    return conditions, {
+        'initial': len(raw),
+        'valid': len(conditions),
+        'unique_codes': conditions['CODE'].unique(),
+    }
 
-if __name__ == "__main__":
-    conditions = load_conditions(
-        DATA_DIR/'conditions.csv.gz',
-        OUTPUT_DIR/'clean_patients.csv'
-    )
+def load_conditions(conditions_path, clean_patients_path):
+    """Load and validate conditions data"""
+    conditions = load_table('conditions', path=conditions_path)
+    return clean_conditions(conditions, load_patient_index(clean_patients_path), Path(conditions_path).parent)
+
+def run_stage(valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Read the raw conditions once, clean, save and return the report counts"""
+    with step('load') as s:
+        raw = load_table('conditions', data_dir=data_dir, block_dir=blocked_dir(output_dir))
+        s['rows_out'] = len(raw)
+    conditions = clean_conditions(raw, valid_patients, data_dir, output_dir)
+    with step('write', len(conditions)) as s:
+        path = write_table(conditions, 'clean_conditions', output_dir)
+        s.update(rows_out=len(conditions), bytes=path.stat().st_size)
     
-    # Save results
-    conditions.to_csv(OUTPUT_DIR/'clean_conditions.csv', index=False)
+    return {
+        'initial': len(raw),
+        'valid': len(conditions),
+        'unique_codes': conditions['CODE'].nunique(),
+    }
+
+def report(counts):
+    print("### Conditions Cleaning Report")
+    print(f"Initial conditions: {counts['initial']}")
+    print(f"Valid conditions: {counts['valid']}")
+    print(f"SNOMED codes: {counts['unique_codes']} unique codes")
+
+
+if __name__ == "__main__":
+    valid_patients = load_patient_index(OUTPUT_DIR/'clean_patients.parquet')
+    counts = run_stage(valid_patients)
     
     # Reporting
-    display(Markdown("### Conditions Cleaning Report"))
-    display(f"Initial conditions: {len(pd.read_csv(DATA_DIR/'conditions.csv.gz'))}")
-    display(f"Valid conditions: {len(conditions)}")
-    display(f"SNOMED codes: {conditions['CODE'].nunique()} unique codes")
+    report(counts)
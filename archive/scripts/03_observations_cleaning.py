@@ -1,11 +1,15 @@
 # 03_observations_cleaning.py
 
 import pandas as pd
-import numpy as np
 from pathlib import Path
-import gzip
-from IPython.display import display, Markdown
-import matplotlib.pyplot as plt
+from store import chunk_writer, table_path, write_chunks, write_table
+from loader import iter_table, load_table
+from ingest import blocked_dir
+import terminology
+from temporal import parse_table
+from patient_index import build_patient_index, linked, load_patient_index
+from telemetry import iter_step, step
+from validation import validate_ranges
 
 DATA_DIR = Path('data/original')
 OUTPUT_DIR = Path('data/processed')
@@ -18,6 +22,60 @@ OUTPUT_DIR = Path('data/processed')
 # - **BMI**: `39156-5`
 
 # %%
+# Rows per chunk in streaming mode; peak memory scales with this, not the file size
+CHUNK_SIZE = 250_000
+
+BP_CODES = ['8480-6', '8462-4']
+
+# Rows failing the range rules (validation.RULES), with their REASON
+QUARANTINE_TABLE = 'quarantined_observations'
+
+def split_observations_chunk(obs, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Apply the observation QC steps to one frame; returns (valid, quarantined) rows"""
+    # 1. Patient linkage
+    with step('patient_filter', len(obs)) as s:
+        obs = obs[linked(obs['PATIENT'], valid_patients)]
+        s['rows_out'] = len(obs)
+    
+    # 2. LOINC validation
+    with step('code_validation', len(obs)) as s:
+        cache_dir = terminology.index_cache_dir(output_dir)
+        valid_obs = obs[terminology.is_valid('loinc', obs['CODE'], data_dir, cache_dir)].copy()  # Make sure it's a copy
+        s['rows_out'] = len(valid_obs)
+    
+    with step('type_coercion', len(valid_obs)) as s:
+        # 3. Numeric value extraction
+        valid_obs.loc[:, 'VALUE_NUM'] = pd.to_numeric(valid_obs['VALUE'], errors='coerce')
+        
+        # 4. Unit standardization
+        valid_obs.loc[:, 'UNITS'] = valid_obs['UNITS'].str.lower().str.strip()
+        
+        # 5. Timestamps as UTC datetimes
+        valid_obs = parse_table(valid_obs, 'observations')
+        s['rows_out'] = len(valid_obs)
+    
+    # 6. Range validation in canonical units; failures go to quarantine
+    with step('range_validation', len(valid_obs)) as s:
+        valid_obs, quarantined = validate_ranges(valid_obs)
+        s['rows_out'] = len(valid_obs)
+    
+    return valid_obs, quarantined
+
+def clean_observations_chunk(obs, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Apply the observation QC steps to one frame (full table or chunk)"""
+    return split_observations_chunk(obs, valid_patients, data_dir, output_dir)[0]
+
+def clean_block(raw, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Clean one chunk and return its cleaned and quarantined rows with its row counts"""
+    valid_obs, quarantined = split_observations_chunk(raw, valid_patients, data_dir, output_dir)
+    return {'clean_observations': valid_obs, QUARANTINE_TABLE: quarantined}, {
+        'original': len(raw),
+        'valid': len(valid_obs),
+        'quarantined': len(quarantined),
+        'bp': int(valid_obs['CODE'].isin(BP_CODES).sum()),
+        'chunks': 1,
+    }
+
 def clean_observations(obs_path, clean_patients_path):
     """
     Cleans observations data with:
@@ -26,44 +84,64 @@ def clean_observations(obs_path, clean_patients_path):
     3. Unit standardization
     4. Range validation
     """
-    obs = pd.read_csv(obs_path)
-    valid_patients = pd.read_csv(clean_patients_path)['id']
+    obs = load_table('observations', path=obs_path)
+    valid_patients = load_patient_index(clean_patients_path)
     
-    # 1. Patient linkage
-    obs = obs[obs['PATIENT'].isin(valid_patients)]
-    
-    # 2. LOINC validation
-    loinc_codes = pd.read_csv(DATA_DIR/'dictionary_loinc.csv')['CODE']
-    valid_obs = obs[obs['CODE'].isin(loinc_codes)].copy()  # Make sure it's a copy
-    
-    # 3. Numeric value extraction
-    valid_obs.loc[:, 'VALUE_NUM'] = pd.to_numeric(valid_obs['VALUE'], errors='coerce')
-    
-    # 4. Unit standardization
-    valid_obs.loc[:, 'UNITS'] = valid_obs['UNITS'].str.lower().str.strip()
-    
-    return valid_obs
+    return clean_observations_chunk(obs, valid_patients, Path(obs_path).parent)
 
-if __name__ == "__main__":
-    observations = clean_observations(
-        DATA_DIR/'observations.csv.gz',
-        OUTPUT_DIR/'clean_patients.csv'
-    )
+def stream_observations(obs_path, valid_patients, output_dir=OUTPUT_DIR, chunksize=CHUNK_SIZE, data_dir=DATA_DIR):
+    """
+    Streaming variant of clean_observations for tables that do not fit in memory.
+    Reads the gzip in chunks, cleans each chunk and appends it to clean_observations,
+    and its quarantined rows to quarantined_observations, so no table is held whole.
+    Codes are checked against data_dir's LOINC dictionary. Returns the row counts
+    gathered along the way.
+    """
+    valid_patients = build_patient_index(valid_patients)  # hash once, probe per chunk
     
-    # Save outputs
-    observations.to_csv(OUTPUT_DIR/'clean_observations.csv', index=False)
+    counts = {'original': 0, 'valid': 0, 'quarantined': 0, 'bp': 0, 'chunks': 0}
+    no_quarantine = None  # empty quarantine frame, written if no chunk quarantines a row
     
-    # Reporting
-    print("### Observations Cleaning Report")
-    print(f"Original observations: {len(pd.read_csv(DATA_DIR/'observations.csv.gz')):,}")
-    print(f"Valid observations: {len(observations):,}")
-
-    # Blood Pressure stats
-    bp_codes = ['8480-6', '8462-4']
-    bp_data = observations[observations['CODE'].isin(bp_codes)]
-    print(f"**Blood Pressure Records**: {len(bp_data):,}")
-
+    def cleaned_chunks(append_quarantined):
+        nonlocal no_quarantine
+        # The loader's fixed schema makes every chunk parse the same way
+        for chunk in iter_step('load', iter_table('observations', chunksize, path=obs_path,
+                                                    block_dir=blocked_dir(output_dir))):
+            frames, chunk_counts = clean_block(chunk, valid_patients, data_dir, output_dir)
+            for key, value in chunk_counts.items():
+                counts[key] += value
+            if chunk_counts['quarantined']:
+                append_quarantined(frames[QUARANTINE_TABLE])
+            elif no_quarantine is None:
+                no_quarantine = frames[QUARANTINE_TABLE]
+            yield frames['clean_observations']
     
+    # The write step includes the loading and cleaning it drives; its self time is the write alone
+    with step('write') as s:
+        with chunk_writer(QUARANTINE_TABLE, output_dir) as append_quarantined:
+            path = write_chunks(cleaned_chunks(append_quarantined), 'clean_observations', output_dir)
+        if not counts['quarantined']:
+            write_table(no_quarantine, QUARANTINE_TABLE, output_dir)
+        quarantine_path = table_path(QUARANTINE_TABLE, output_dir)
+        s.update(rows_in=counts['valid'] + counts['quarantined'], rows_out=counts['valid'],
+                 bytes=path.stat().st_size + quarantine_path.stat().st_size)
+    return counts
 
+def run_stage(valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Stream the raw observations once, clean, save and return the report counts"""
+    return stream_observations(data_dir/'observations.csv.gz', valid_patients, output_dir, data_dir=data_dir)
 
+def report(counts):
+    print("### Observations Cleaning Report")
+    print(f"Original observations: {counts['original']:,}")
+    print(f"Valid observations: {counts['valid']:,}")
+    print(f"Quarantined (implausible value or unit): {counts.get('quarantined', 0):,}")
+    print(f"**Blood Pressure Records**: {counts['bp']:,}")
 
+if __name__ == "__main__":
+    # Stream the raw file once, writing cleaned chunks as we go
+    valid_patients = load_patient_index(OUTPUT_DIR/'clean_patients.parquet')
+    counts = run_stage(valid_patients)
+    
+    # Reporting
+    report(counts)
@@ -1,50 +1,89 @@
 # 04_medications_cleaning.py
 
-import pandas as pd
-import numpy as np
 from pathlib import Path
-from IPython.display import display, Markdown
-import gzip
+from store import write_table
+from loader import load_table
+from ingest import blocked_dir
+import terminology
+from temporal import parse_table
+from patient_index import linked, load_patient_index
+from telemetry import step
 
 # Configuration
 DATA_DIR = Path('data/original')
 OUTPUT_DIR = Path('data/processed')
 
-def load_medications(meds_path, clean_patients_path):
-    # Load raw medications
-    medications = pd.read_csv(meds_path)
-    valid_patients = pd.read_csv(clean_patients_path)['id']
-
+def clean_medications(medications, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Validate an already loaded medications frame against the valid-patient index and data_dir's RxNorm dictionary"""
     # Filter to valid patients
-    medications = medications[medications['PATIENT'].isin(valid_patients)]
-
-    # Normalize CODE field for matching
-    medications['CODE'] = pd.to_numeric(medications['CODE'], errors='coerce').dropna().astype(int).astype(str)
+    with step('patient_filter', len(medications)) as s:
+        medications = medications[linked(medications['PATIENT'], valid_patients)].copy()
+        s['rows_out'] = len(medications)
+    with step('type_coercion', len(medications)) as s:
+        medications = parse_table(medications, 'medications')
+        s['rows_out'] = len(medications)
 
-    # Load and normalize RXNORM dictionary
-    rxnorm_codes = pd.read_csv(DATA_DIR / 'dictionary_rxnorm.csv')
-    rxnorm_codes['CODE'] = rxnorm_codes['CODE'].astype(str)
+    with step('code_validation', len(medications)) as s:
+        # RXNORM dictionary from the terminology index (codes are normalized strings on both sides)
+        cache_dir = terminology.index_cache_dir(output_dir)
+        rxnorm_codes = terminology.load_index('rxnorm', data_dir, cache_dir).reset_index()
 
-    # Filter meds by valid RXNORM codes
-    valid_meds = medications[medications['CODE'].isin(rxnorm_codes['CODE'])]
+        # Filter meds by valid RXNORM codes
+        valid_meds = medications[terminology.is_valid('rxnorm', medications['CODE'], data_dir, cache_dir)]
+        s['rows_out'] = len(valid_meds)
 
     return medications, valid_meds, rxnorm_codes
 
-if __name__ == "__main__":
-    raw_meds, valid_meds, rxnorm = load_medications(
-        DATA_DIR / 'medications.csv.gz',
-        OUTPUT_DIR / 'clean_patients.csv'
-    )
+def clean_block(raw, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Clean one block of raw medications for incremental runs; counts are per block"""
+    linked_meds, valid_meds, _ = clean_medications(raw, valid_patients, data_dir, output_dir)
+    return valid_meds, {
+        'initial': len(raw),
+        'linked': len(linked_meds),
+        'valid': len(valid_meds),
+        'unique_patients': linked_meds['PATIENT'].unique(),
+        'unique_codes': linked_meds['CODE'].unique(),
+        'dictionary_overlap': valid_meds['CODE'].unique(),
+    }
+
+def load_medications(meds_path, clean_patients_path):
+    # Load raw medications
+    medications = load_table('medications', path=meds_path)
+    return clean_medications(medications, load_patient_index(clean_patients_path), Path(meds_path).parent)
+
+def run_stage(valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Read the raw medications once, clean, save and return the report counts"""
+    with step('load') as s:
+        raw = load_table('medications', data_dir=data_dir, block_dir=blocked_dir(output_dir))
+        s['rows_out'] = len(raw)
+    linked_meds, valid_meds, rxnorm = clean_medications(raw, valid_patients, data_dir, output_dir)
 
     # Save cleaned output
-    valid_meds.to_csv(OUTPUT_DIR / 'clean_medications.csv', index=False)
+    with step('write', len(valid_meds)) as s:
+        path = write_table(valid_meds, 'clean_medications', output_dir)
+        s.update(rows_out=len(valid_meds), bytes=path.stat().st_size)
 
-    # Reporting
-    display(Markdown("### Medications Cleaning Report"))
-    print(f"Total raw medications: {len(raw_meds)}")
-    print(f"Valid medications: {len(valid_meds)}")
-    print(f"Unique patients in meds: {raw_meds['PATIENT'].nunique()}")
-    print(f"Overlap with clean patients: {raw_meds['PATIENT'].isin(pd.read_csv(OUTPUT_DIR / 'clean_patients.csv')['id']).sum()}")
-    print(f"Unique RXNORM codes in meds: {raw_meds['CODE'].nunique()}")
-    print(f"Overlap with RXNORM dict: {valid_meds['CODE'].nunique()}")
+    return {
+        'initial': len(raw),
+        'linked': len(linked_meds),
+        'valid': len(valid_meds),
+        'unique_patients': linked_meds['PATIENT'].nunique(),
+        'unique_codes': linked_meds['CODE'].nunique(),
+        'dictionary_overlap': valid_meds['CODE'].nunique(),
+    }
+
+def report(counts):
+    print("### Medications Cleaning Report")
+    print(f"Total raw medications: {counts['initial']}")
+    print(f"Valid medications: {counts['valid']}")
+    print(f"Unique patients in meds: {counts['unique_patients']}")
+    print(f"Overlap with clean patients: {counts['linked']}")
+    print(f"Unique RXNORM codes in meds: {counts['unique_codes']}")
+    print(f"Overlap with RXNORM dict: {counts['dictionary_overlap']}")
 
+if __name__ == "__main__":
+    valid_patients = load_patient_index(OUTPUT_DIR / 'clean_patients.parquet')
+    counts = run_stage(valid_patients)
+
+    # Reporting
+    report(counts)
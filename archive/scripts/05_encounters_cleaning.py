@@ -1,43 +1,77 @@
 # 05_encounters_cleaning.py
 
-import pandas as pd
-import numpy as np
 from pathlib import Path
-import gzip
+from store import write_table
+from loader import load_table
+from ingest import blocked_dir
+from patient_index import linked, load_patient_index
+from temporal import parse_table
+from telemetry import step
 
 # Configuration
 DATA_DIR = Path('data/original')
 OUTPUT_DIR = Path('data/processed')
 
-def load_encounters(encounters_path, clean_patients_path):
-    """Load and validate encounters data"""
-    encounters = pd.read_csv(encounters_path)
-    valid_patients = pd.read_csv(clean_patients_path)['id']
-    
+def clean_encounters(encounters, valid_patients):
+    """Validate an already loaded encounters frame against the valid-patient index"""
     # QC: Filter encounters with valid patient IDs
-    encounters = encounters[encounters['PATIENT'].isin(valid_patients)]
+    with step('patient_filter', len(encounters)) as s:
+        encounters = encounters[linked(encounters['PATIENT'], valid_patients)].copy()
+        s['rows_out'] = len(encounters)
     
-    # Handle date columns: Convert to datetime, coerce errors
-    encounters['START'] = pd.to_datetime(encounters['START'], errors='coerce')
-    encounters['STOP'] = pd.to_datetime(encounters['STOP'], errors='coerce')
+    # Handle date columns: Convert to UTC datetimes, coerce errors
+    with step('type_coercion', len(encounters)) as s:
+        encounters = parse_table(encounters, 'encounters')
+        s['rows_out'] = len(encounters)
     
     # Filter out any rows with invalid dates or missing key fields
-    encounters = encounters.dropna(subset=['PATIENT', 'START'])
+    with step('validation', len(encounters)) as s:
+        encounters = encounters.dropna(subset=['PATIENT', 'START'])
+        s['rows_out'] = len(encounters)
     
     # Add any additional cleaning logic based on specific encounter attributes
     return encounters
 
-if __name__ == "__main__":
-    encounters = load_encounters(
-        DATA_DIR/'encounters.csv.gz',
-        OUTPUT_DIR/'clean_patients.csv'
-    )
+def clean_block(raw, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Clean one block of raw encounters for incremental runs (no dictionary to read); counts are per block"""
+    encounters = clean_encounters(raw, valid_patients)
+    return encounters, {
+        'initial': len(raw),
+        'valid': len(encounters),
+        'unique_patients': encounters['PATIENT'].unique(),
+    }
+
+def load_encounters(encounters_path, clean_patients_path):
+    """Load and validate encounters data"""
+    encounters = load_table('encounters', path=encounters_path)
+    return clean_encounters(encounters, load_patient_index(clean_patients_path))
+
+def run_stage(valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Read the raw encounters once, clean, save and return the report counts"""
+    with step('load') as s:
+        raw = load_table('encounters', data_dir=data_dir, block_dir=blocked_dir(output_dir))
+        s['rows_out'] = len(raw)
+    encounters = clean_encounters(raw, valid_patients)
     
     # Save cleaned encounters data
-    encounters.to_csv(OUTPUT_DIR/'clean_encounters.csv', index=False)
+    with step('write', len(encounters)) as s:
+        path = write_table(encounters, 'clean_encounters', output_dir)
+        s.update(rows_out=len(encounters), bytes=path.stat().st_size)
     
-    # Reporting
-    print(f"Initial encounters: {len(pd.read_csv(DATA_DIR/'encounters.csv.gz'))}")
-    print(f"Valid encounters: {len(encounters)}")
-    print(f"Unique patients in encounters: {encounters['PATIENT'].nunique()}")
+    return {
+        'initial': len(raw),
+        'valid': len(encounters),
+        'unique_patients': encounters['PATIENT'].nunique(),
+    }
+
+def report(counts):
+    print(f"Initial encounters: {counts['initial']}")
+    print(f"Valid encounters: {counts['valid']}")
+    print(f"Unique patients in encounters: {counts['unique_patients']}")
 
+if __name__ == "__main__":
+    valid_patients = load_patient_index(OUTPUT_DIR/'clean_patients.parquet')
+    counts = run_stage(valid_patients)
+    
+    # Reporting
+    report(counts)
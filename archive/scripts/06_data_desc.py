@@ -2,50 +2,84 @@
 
 import pandas as pd
 from pathlib import Path  # Make sure to import Path
+from partitions import LAYOUT_DIR, PATIENT_KEYS, linkage_counts, map_buckets
+from query import sql
+import terminology
+from profiling import QUANTILE_LABELS, REPORT_FILE, load_report, profile_table
 
 # Paths to cleaned data
 OUTPUT_DIR = Path('data/processed')
-clean_patients = pd.read_csv(OUTPUT_DIR / 'clean_patients.csv')
-clean_conditions = pd.read_csv(OUTPUT_DIR / 'clean_conditions.csv')
-clean_observations = pd.read_csv(OUTPUT_DIR / 'clean_observations.csv')
-clean_medications = pd.read_csv(OUTPUT_DIR / 'clean_medications.csv')
-clean_encounters = pd.read_csv(OUTPUT_DIR / 'clean_encounters.csv')
 
-# 1. Unique patients in each dataset
-print(f"Unique patients in clean_patients: {clean_patients['id'].nunique()}")
-print(f"Unique patients in clean_conditions: {clean_conditions['PATIENT'].nunique()}")
-print(f"Unique patients in clean_observations: {clean_observations['PATIENT'].nunique()}")
-print(f"Unique patients in clean_medications: {clean_medications['PATIENT'].nunique()}")
-print(f"Unique patients in clean_encounters: {clean_encounters['PATIENT'].nunique()}")
+def describe(name, profile):
+    """describe()-style summary of every column of a table, from its profile"""
+    summary = {col: {'count': s['count'] - s['nulls'], 'distinct': s['distinct'], 'mean': s.get('mean'),
+                     'std': s.get('std'), 'min': s.get('min'), **s.get('quantiles', {}), 'max': s.get('max'),
+                     'top': s['top'][0][0] if s.get('top') else None}
+               for col, s in profile[name]['columns'].items()}
+    return pd.DataFrame(summary, index=['count', 'distinct', 'mean', 'std', 'min', *QUANTILE_LABELS, 'max', 'top'])
 
-# 2. Most frequent ontology terms (SNOMED, LOINC, RXNORM)
-# Conditions: SNOMED codes
-print("\nMost frequent SNOMED codes in conditions:")
-print(clean_conditions['CODE'].value_counts().head())
+def top_codes(table, system, n=5):
+    """Most frequent codes of a table with the dictionary description of each code"""
+    top = sql(f"SELECT CODE, count(*) AS count FROM {table} GROUP BY CODE ORDER BY count DESC LIMIT {int(n)}",
+              output_dir=OUTPUT_DIR).set_index('CODE')
+    top['description'] = terminology.describe(system, top.index)
+    return top
 
-# Observations: LOINC codes
-print("\nMost frequent LOINC codes in observations:")
-print(clean_observations['CODE'].value_counts().head())
+def main():
+    # 1. Unique patients in each dataset (counted by the SQL layer, no table is loaded)
+    unique_patients = sql("""
+        SELECT 'clean_patients' AS table_name, count(DISTINCT id) AS patients FROM patients
+        UNION ALL SELECT 'clean_conditions', count(DISTINCT PATIENT) FROM conditions
+        UNION ALL SELECT 'clean_observations', count(DISTINCT PATIENT) FROM observations
+        UNION ALL SELECT 'clean_medications', count(DISTINCT PATIENT) FROM medications
+        UNION ALL SELECT 'clean_encounters', count(DISTINCT PATIENT) FROM encounters
+    """, output_dir=OUTPUT_DIR)
+    for table_name, patients in unique_patients.itertuples(index=False):
+        print(f"Unique patients in {table_name}: {patients}")
 
-# Medications: RXNORM codes
-print("\nMost frequent RXNORM codes in medications:")
-print(clean_medications['CODE'].value_counts().head())
+    # Per-patient record counts across all tables, joined bucket by bucket on the patient-hash layout
+    if (OUTPUT_DIR / LAYOUT_DIR / 'layout.json').exists():
+        linkage = pd.concat(map_buckets(linkage_counts, {name: {'columns': [key]} for name, key in PATIENT_KEYS.items()},
+                                        output_dir=OUTPUT_DIR))
+        print("\nRecords per patient:")
+        print(linkage.describe().T[['mean', '50%', 'max']])
+        print(f"Patients with encounters but no medications: "
+              f"{((linkage['encounters'] > 0) & (linkage['medications'] == 0)).sum()}")
 
-# 3. General stats (optional, you can expand with other metrics)
-print("\nGeneral stats for cleaned data:")
+    # 2. Most frequent ontology terms (SNOMED, LOINC, RXNORM)
+    # Conditions: SNOMED codes
+    print("\nMost frequent SNOMED codes in conditions:")
+    print(top_codes('conditions', 'snomed'))
 
-# Clean patients
-print(f"\nClean patients data summary:\n{clean_patients.describe()}")
+    # Observations: LOINC codes
+    print("\nMost frequent LOINC codes in observations:")
+    print(top_codes('observations', 'loinc'))
 
-# Clean conditions
-print(f"\nClean conditions data summary:\n{clean_conditions.describe()}")
+    # Medications: RXNORM codes
+    print("\nMost frequent RXNORM codes in medications:")
+    print(top_codes('medications', 'rxnorm'))
 
-# Clean observations
-print(f"\nClean observations data summary:\n{clean_observations.describe()}")
+    # 3. General stats from the streaming profile (profiling.py); no table is loaded whole
+    print("\nGeneral stats for cleaned data:")
+    if (OUTPUT_DIR / REPORT_FILE).exists():
+        profile = load_report(OUTPUT_DIR / REPORT_FILE)
+    else:
+        profile = {name: profile_table(name, OUTPUT_DIR) for name in PATIENT_KEYS}
 
-# Clean medications
-print(f"\nClean medications data summary:\n{clean_medications.describe()}")
+    # Clean patients
+    print(f"\nClean patients data summary:\n{describe('clean_patients', profile)}")
 
-# Clean encounters
-print(f"\nClean encounters data summary:\n{clean_encounters.describe()}")
+    # Clean conditions
+    print(f"\nClean conditions data summary:\n{describe('clean_conditions', profile)}")
 
+    # Clean observations
+    print(f"\nClean observations data summary:\n{describe('clean_observations', profile)}")
+
+    # Clean medications
+    print(f"\nClean medications data summary:\n{describe('clean_medications', profile)}")
+
+    # Clean encounters
+    print(f"\nClean encounters data summary:\n{describe('clean_encounters', profile)}")
+
+if __name__ == "__main__":
+    main()
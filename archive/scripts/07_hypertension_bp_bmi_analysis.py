@@ -1,64 +1,73 @@
 # 07_hypertension_bp_bmi_analysis.py
 
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+import argparse
+import figures
+from encoding import compact, shared_patient_index
+from vitals import load_vitals
+from cohorts import cohort, load_phenotypes
+from density import density_curve, load_densities
+from exposure import load_exposures, treated
 
-# --- Load Data ---
-print("Loading data...")
-conditions = pd.read_csv("data/original/conditions.csv.gz")
-observations = pd.read_csv("data/original/observations.csv.gz")
+def main():
+    parser = argparse.ArgumentParser(description="BP and BMI of hypertensive patients")
+    figures.add_argument(parser)
+    figures.set_mode(parser.parse_args().plots)
 
-# --- Identify hypertensive patients ---
-print("Identifying hypertensive patients...")
-hypertension_code = 59621000
-hypertension_patients = conditions[conditions['CODE'] == hypertension_code]['PATIENT'].unique()
-print(f"Number of hypertensive patients: {len(hypertension_patients)}")
+    # --- Load Data ---
+    print("Loading data...")
+    phenotypes = load_phenotypes()
+    vitals = load_vitals()
 
-# --- Filter BP observations ---
-print("Filtering BP observations...")
-bp_codes = ['8462-4', '8480-6']  # Diastolic, Systolic
-observations['VALUE'] = pd.to_numeric(observations['VALUE'], errors='coerce')
-bp_obs = observations[observations['CODE'].isin(bp_codes)]
-bp_obs_hyper = bp_obs[bp_obs['PATIENT'].isin(hypertension_patients)].copy()
+    # Patients as dense int positions: cheaper isin
+    patient_index = shared_patient_index(phenotypes['PATIENT'], vitals['PATIENT'])
+    phenotypes = compact(phenotypes, patient_index)
+    vitals = compact(vitals, patient_index)
 
-# Pivot systolic/diastolic per patient-date-encounter
-bp_pivot = bp_obs_hyper.pivot_table(
-    index=['DATE', 'PATIENT', 'ENCOUNTER'],
-    columns='CODE',
-    values='VALUE'
-).reset_index().rename(columns={'8480-6': 'SYSTOLIC_BP', '8462-4': 'DIASTOLIC_BP'})
-print(f"Blood pressure observations: {len(bp_pivot)}")
+    # --- Identify hypertensive patients ---
+    print("Identifying hypertensive patients...")
+    hypertension_patients = cohort('hypertension', phenotypes).unique()
+    print(f"Number of hypertensive patients: {len(hypertension_patients)}")
 
-# --- Filter BMI observations ---
-print("Filtering BMI observations...")
-bmi_code = '39156-5'
-bmi_obs = observations[(observations['CODE'] == bmi_code) & (observations['PATIENT'].isin(hypertension_patients))]
-bmi_obs['VALUE'] = pd.to_numeric(bmi_obs['VALUE'], errors='coerce')
-print(f"BMI observations: {len(bmi_obs)}")
+    vitals_hyper = vitals[vitals['PATIENT'].isin(hypertension_patients)]
 
-# --- Summary ---
-print("\n--- Summary Statistics ---")
-print(bp_pivot[['SYSTOLIC_BP', 'DIASTOLIC_BP']].describe())
-print("\nBMI Summary:")
-print(bmi_obs['VALUE'].describe())
+    # --- BP readings (systolic/diastolic per patient-date-encounter) ---
+    print("Filtering BP observations...")
+    bp_pivot = vitals_hyper.dropna(subset=['SYSTOLIC_BP', 'DIASTOLIC_BP'], how='all')
+    print(f"Blood pressure observations: {len(bp_pivot)}")
 
-# --- Plots ---
-plt.figure(figsize=(12, 5))
-sns.kdeplot(bp_pivot['SYSTOLIC_BP'].dropna(), label="Systolic", fill=True)
-sns.kdeplot(bp_pivot['DIASTOLIC_BP'].dropna(), label="Diastolic", fill=True)
-plt.title("Distribution of Blood Pressure (Hypertensive Patients)")
-plt.xlabel("Blood Pressure (mmHg)")
-plt.ylabel("Density")
-plt.legend()
-plt.tight_layout()
-plt.show()
+    # --- BMI readings ---
+    print("Filtering BMI observations...")
+    bmi_obs = vitals_hyper.dropna(subset=['BMI'])
+    print(f"BMI observations: {len(bmi_obs)}")
 
-plt.figure(figsize=(8, 5))
-sns.kdeplot(bmi_obs['VALUE'].dropna(), label="BMI", fill=True, color="purple")
-plt.title("Distribution of BMI (Hypertensive Patients)")
-plt.xlabel("BMI")
-plt.ylabel("Density")
-plt.tight_layout()
-plt.show()
+    # --- Treatment status at each BP reading ---
+    print("Flagging readings taken on an antihypertensive...")
+    exposures = compact(load_exposures(), patient_index)
+    bp_pivot = bp_pivot.assign(TREATED=treated(bp_pivot, 'antihypertensive', exposures))
+    print(f"Treated BP observations: {bp_pivot['TREATED'].sum()} of {len(bp_pivot)}")
 
+    # --- Summary ---
+    print("\n--- Summary Statistics ---")
+    print(bp_pivot[['SYSTOLIC_BP', 'DIASTOLIC_BP']].describe())
+    print("\nBMI Summary:")
+    print(bmi_obs['BMI'].describe())
+    print("\nMean BP by treatment status:")
+    print(bp_pivot.groupby('TREATED')[['SYSTOLIC_BP', 'DIASTOLIC_BP']].agg(['mean', 'count']))
+
+    # --- Plots ---
+    # KDEs over every reading, precomputed by the densities stage; a stats-only run loads none
+    if figures.plot_mode() != 'none':
+        densities = load_densities()
+        figures.density_figure("07_bp_hypertensive", [
+            ("Systolic", *density_curve(densities, 'SYSTOLIC_BP'), None),
+            ("Diastolic", *density_curve(densities, 'DIASTOLIC_BP'), None),
+        ], title="Distribution of Blood Pressure (Hypertensive Patients)", xlabel="Blood Pressure (mmHg)",
+            fill=True, figsize=(12, 5))
+
+        figures.density_figure("07_bmi_hypertensive", [
+            ("BMI", *density_curve(densities, 'BMI'), "purple"),
+        ], title="Distribution of BMI (Hypertensive Patients)", xlabel="BMI", fill=True)
+    figures.finish()
+
+if __name__ == "__main__":
+    main()
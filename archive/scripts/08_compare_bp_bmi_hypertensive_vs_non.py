@@ -1,100 +1,79 @@
 # 08_compare_bp_bmi_hypertensive_vs_non.py
 
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+import argparse
 from pathlib import Path
-import numpy as np
+import figures
+from encoding import compact, expand, shared_patient_index
+from vitals import BMI_TOLERANCE, align_vitals, load_vitals
+from cohorts import cohort, load_phenotypes
+from density import density_curve, load_densities
+from exposure import load_exposures, treated
 
 
 # Configuration
 DATA_DIR = Path("data/original")
 OUTPUT_DIR = Path("data/processed")
 
-# Load data
-print("Loading data...")
-conditions = pd.read_csv(DATA_DIR / "conditions.csv.gz", compression="gzip")
-observations = pd.read_csv(DATA_DIR / "observations.csv.gz", compression="gzip")
-
-# Show a sample of the conditions DataFrame
-print("\n--- Sample of Conditions DataFrame ---")
-print(conditions.head())
-
-# Ensure 'CODE' is string for comparison
-conditions["CODE"] = conditions["CODE"].astype(str).str.strip()
-
-# Hypertension SNOMED codes
-hypertensive_codes = ["10509002.0", "283371005.0", "444814009.0"]
-
-# Identify hypertensive patients
-print("\nIdentifying hypertensive patients...")
-hypertensive_patients = conditions[conditions["CODE"].isin(hypertensive_codes)]["PATIENT"].unique()
-print(f"Number of hypertensive patients: {len(hypertensive_patients)}")
-
-# Filter for Systolic, Diastolic BP, and BMI
-systolic_code = "8480-6"
-diastolic_code = "8462-4"
-bmi_code = "39156-5"
-
-# Make sure 'CODE' is string in observations too
-observations["CODE"] = observations["CODE"].astype(str).str.strip()
-
-# Extract relevant observations
-bp_sys = observations[observations["CODE"] == systolic_code][["PATIENT", "VALUE"]].rename(columns={"VALUE": "SYSTOLIC_BP"})
-bp_dia = observations[observations["CODE"] == diastolic_code][["PATIENT", "VALUE"]].rename(columns={"VALUE": "DIASTOLIC_BP"})
-bmi = observations[observations["CODE"] == bmi_code][["PATIENT", "VALUE"]].rename(columns={"VALUE": "BMI"})
-
-# Merge BP readings
-bp = pd.merge(bp_sys, bp_dia, on="PATIENT", how="inner")
-
-# Merge with BMI
-bp_bmi = pd.merge(bp, bmi, on="PATIENT", how="inner")
-
-# Tag hypertensive vs non-hypertensive
-bp_bmi["HYPERTENSIVE"] = bp_bmi["PATIENT"].isin(hypertensive_patients)
-
-# Convert columns to numeric, forcing errors to NaN
-bp_bmi["SYSTOLIC_BP"] = pd.to_numeric(bp_bmi["SYSTOLIC_BP"], errors='coerce')
-bp_bmi["DIASTOLIC_BP"] = pd.to_numeric(bp_bmi["DIASTOLIC_BP"], errors='coerce')
-bp_bmi["BMI"] = pd.to_numeric(bp_bmi["BMI"], errors='coerce')
-
-# Check shapes of the relevant data to ensure they are 1D
-print("\n--- Checking Shapes of Data ---")
-print(f"Shape of Systolic BP: {bp_bmi['SYSTOLIC_BP'].dropna().shape}")
-print(f"Shape of BMI: {bp_bmi['BMI'].dropna().shape}")
-
-# Plotting
-# Ensure we pass numpy arrays for the KDE plot
-plt.figure(figsize=(14, 7))
-
-# For faster plotting, sample a subset of data (e.g., 10% of the data)
-sample_size = 0.1
-hyper_sample = bp_bmi[bp_bmi["HYPERTENSIVE"]].sample(frac=sample_size, random_state=42)
-nonhyper_sample = bp_bmi[~bp_bmi["HYPERTENSIVE"]].sample(frac=sample_size, random_state=42)
-
-# Convert the SYSTOLIC_BP column to a numpy array and flatten it
-hypertensive_systolic_bp = np.ravel(hyper_sample["SYSTOLIC_BP"].dropna().values)
-non_hypertensive_systolic_bp = np.ravel(nonhyper_sample["SYSTOLIC_BP"].dropna().values)
-
-# Plotting the density plots
-sns.kdeplot(hypertensive_systolic_bp, label="Hypertensive", color="red")
-sns.kdeplot(non_hypertensive_systolic_bp, label="Non-Hypertensive", color="blue")
-
-plt.title("Systolic BP Distribution (Sampled Data)")
-plt.xlabel("Systolic BP")
-plt.ylabel("Density")
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-# BMI Plot
-plt.figure(figsize=(14, 7))
-sns.kdeplot(np.ravel(hyper_sample["BMI"].dropna().values), label="Hypertensive", color="red")
-sns.kdeplot(np.ravel(nonhyper_sample["BMI"].dropna().values), label="Non-Hypertensive", color="blue")
-plt.title("BMI Distribution (Sampled Data)")
-plt.xlabel("BMI")
-plt.ylabel("Density")
-plt.legend()
-plt.tight_layout()
-plt.show()
-
+def main():
+    parser = argparse.ArgumentParser(description="Compare BP and BMI of hypertensive and other patients")
+    figures.add_argument(parser)
+    figures.set_mode(parser.parse_args().plots)
+
+    # Load data
+    print("Loading data...")
+    phenotypes = load_phenotypes(output_dir=OUTPUT_DIR)
+    vitals = load_vitals(output_dir=OUTPUT_DIR)
+
+    # Patients as dense int positions: cheaper isin and merges
+    patient_index = shared_patient_index(phenotypes["PATIENT"], vitals["PATIENT"])
+    phenotypes = compact(phenotypes, patient_index)
+    vitals = compact(vitals, patient_index)
+
+    # Show a sample of the per-patient phenotype table
+    print("\n--- Sample of Phenotypes DataFrame ---")
+    print(expand(phenotypes.head(), patient_index))
+
+    # Identify hypertensive patients (cohort definition in cohorts.PHENOTYPES)
+    print("\nIdentifying hypertensive patients...")
+    hypertensive_patients = cohort("hypertension", phenotypes).unique()
+    print(f"Number of hypertensive patients: {len(hypertensive_patients)}")
+
+    # Pair each BP reading with the nearest BMI of the same patient (time-aligned as-of join)
+    bp_bmi = align_vitals(vitals, tolerance=BMI_TOLERANCE)
+    print(f"BP readings: {len(bp_bmi)}, with a BMI within {BMI_TOLERANCE}: {bp_bmi['BMI'].notna().sum()}")
+
+    # Tag hypertensive vs non-hypertensive
+    bp_bmi["HYPERTENSIVE"] = bp_bmi["PATIENT"].isin(hypertensive_patients)
+
+    # Tag readings taken while on an antihypertensive (exposure intervals from exposure.py)
+    exposures = compact(load_exposures(output_dir=OUTPUT_DIR), patient_index)
+    bp_bmi["TREATED"] = treated(bp_bmi, "antihypertensive", exposures)
+    print("\n--- Mean Systolic BP and BMI by Group and Treatment ---")
+    print(bp_bmi.groupby(["HYPERTENSIVE", "TREATED"])[["SYSTOLIC_BP", "BMI"]].mean())
+
+    # Check shapes of the relevant data to ensure they are 1D
+    print("\n--- Checking Shapes of Data ---")
+    print(f"Shape of Systolic BP: {bp_bmi['SYSTOLIC_BP'].dropna().shape}")
+    print(f"Shape of BMI: {bp_bmi['BMI'].dropna().shape}")
+
+    # Plotting
+    # KDEs over every BP and BMI reading of each group, precomputed by the densities stage;
+    # a stats-only run loads none
+    if figures.plot_mode() != "none":
+        densities = load_densities(output_dir=OUTPUT_DIR)
+
+        # Plotting the density plots
+        figures.density_figure("08_systolic_bp", [
+            ("Hypertensive", *density_curve(densities, "SYSTOLIC_BP", member=True), "red"),
+            ("Non-Hypertensive", *density_curve(densities, "SYSTOLIC_BP", member=False), "blue"),
+        ], title="Systolic BP Distribution", xlabel="Systolic BP", figsize=(14, 7))
+
+        # BMI Plot
+        figures.density_figure("08_bmi", [
+            ("Hypertensive", *density_curve(densities, "BMI", member=True), "red"),
+            ("Non-Hypertensive", *density_curve(densities, "BMI", member=False), "blue"),
+        ], title="BMI Distribution", xlabel="BMI", figsize=(14, 7))
+    figures.finish()
+
+if __name__ == "__main__":
+    main()
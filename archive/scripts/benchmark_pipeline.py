@@ -0,0 +1,124 @@
+# benchmark_pipeline.py
+# Scaling benchmark of the whole pipeline on synthetic Synthea exports.
+# For each scale (number of patients) a dataset is generated once with synthetic.py
+# under data/benchmark/<scale>/, then every pipeline stage and the analysis scripts
+# 06-09 run in a fresh process, recording wall time, peak RSS and rows/sec. Results
+# are compared against a saved baseline; any stage slower or larger than the
+# baseline by more than the tolerance fails the run.
+
+import argparse
+import json
+import os
+import pandas as pd
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# Configuration
+BENCHMARK_DIR = Path('data/benchmark')
+BASELINE_FILE = BENCHMARK_DIR / 'baseline.json'
+SCRIPT_DIR = Path(__file__).resolve().parent
+SCALES = [10_000]
+TOLERANCE = 0.25
+ANALYSES = ['06_data_desc', '07_hypertension_bp_bmi_analysis', '08_compare_bp_bmi_hypertensive_vs_non',
+            '09_hypertension_prevalence']
+
+def _peak_rss_mb(children=False):
+    """Peak RSS of this process (or its largest child), or None without the resource module"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _measure_stage(name, work_dir):
+    """Runs in a fresh worker with work_dir as cwd, so the default relative paths apply"""
+    os.chdir(work_dir)
+    from run_pipeline import DATA_DIR, OUTPUT_DIR, STAGES, execute_stage
+    from patient_index import load_patient_index
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    valid_patients = None
+    if STAGES[name].get('patient_index'):
+        valid_patients = load_patient_index(OUTPUT_DIR / 'clean_patients.parquet')
+    start = time.perf_counter()
+    counts = execute_stage(name, valid_patients, DATA_DIR, OUTPUT_DIR)
+    seconds = time.perf_counter() - start
+    rows = counts.get('initial', counts.get('original', counts.get('rows')))
+    return seconds, _peak_rss_mb(), rows
+
+def _measure_script(script, work_dir):
+    """Runs an analysis script as a child of a fresh worker; its peak RSS is the children's maximum"""
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONPATH=str(SCRIPT_DIR))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(SCRIPT_DIR / f'{script}.py')], cwd=work_dir, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start, _peak_rss_mb(children=True), None
+
+def measure(func, *args):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(func, *args).result()
+
+def prepare(scale, seed=0):
+    """Generate the synthetic export of a scale once; returns its working directory"""
+    work_dir = BENCHMARK_DIR / str(scale)
+    marker = work_dir / 'generated.json'
+    if not marker.exists() or json.loads(marker.read_text()).get('seed') != seed:
+        from synthetic import generate
+        rows = generate(scale, work_dir / 'data' / 'original', seed=seed)
+        marker.write_text(json.dumps({'seed': seed, 'rows': rows}, indent=2))
+    return work_dir.resolve()
+
+def benchmark_scale(scale, analyses=True):
+    from run_pipeline import STAGES
+    work_dir = prepare(scale)
+    results = []
+    steps = [('stage', name) for name in TopologicalSorter({n: s['depends'] + s.get('after', []) for n, s in STAGES.items()}).static_order()]
+    if analyses:
+        steps += [('script', script) for script in ANALYSES]
+    for kind, name in steps:
+        func = _measure_stage if kind == 'stage' else _measure_script
+        seconds, peak_mb, rows = measure(func, name, work_dir)
+        results.append({'scale': scale, 'step': name, 'seconds': seconds, 'peak_rss_mb': peak_mb,
+                        'rows': rows, 'rows_per_s': rows / seconds if rows else None})
+        print(f"[{scale:,}] {name}: {seconds:.2f}s, " + (f"{peak_mb:.0f} MB" if peak_mb is not None else "peak RSS n/a") + (f", {rows / seconds:,.0f} rows/s" if rows else ""))
+    return results
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """Rows of results that are slower or use more memory than the baseline allows"""
+    base = pd.DataFrame(baseline).set_index(['scale', 'step'])
+    current = results.set_index(['scale', 'step'])
+    joined = current.join(base, rsuffix='_baseline', how='inner')
+    failed = ((joined['seconds'] > joined['seconds_baseline'] * (1 + tolerance))
+              | (joined['peak_rss_mb'] > joined['peak_rss_mb_baseline'] * (1 + tolerance)))
+    return joined.loc[failed, ['seconds', 'seconds_baseline', 'peak_rss_mb', 'peak_rss_mb_baseline']]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data")
+    parser.add_argument('--scale', type=int, action='append', help="patients (repeatable), default 10000")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="allowed slowdown, e.g. 0.25")
+    parser.add_argument('--skip-analyses', action='store_true', help="only time the pipeline stages")
+    args = parser.parse_args()
+
+    results = pd.DataFrame([row for scale in (args.scale or SCALES)
+                            for row in benchmark_scale(scale, analyses=not args.skip_analyses)])
+    print("\n=== Pipeline benchmark ===")
+    print(results.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    results.to_csv(BENCHMARK_DIR / 'results.csv', index=False)
+
+    if args.save_baseline:
+        BASELINE_FILE.write_text(results.to_json(orient='records', indent=2))
+        print(f"\nBaseline saved to {BASELINE_FILE}")
+    elif BASELINE_FILE.exists():
+        failed = regressions(results, json.loads(BASELINE_FILE.read_text()), args.tolerance)
+        if len(failed):
+            print(f"\n=== REGRESSIONS (more than {args.tolerance:.0%} over baseline) ===")
+            print(failed.to_string(float_format=lambda x: f"{x:,.2f}"))
+            sys.exit(1)
+        print(f"\nNo regressions against {BASELINE_FILE}")
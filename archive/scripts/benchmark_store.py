@@ -0,0 +1,70 @@
+# benchmark_store.py
+# Compares the Parquet store against the old CSV hand-off for every cleaned table:
+# on-disk size, read time and peak RSS of a full read and of a projected read.
+
+import pandas as pd
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from store import read_file, read_table, write_table
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+OUTPUT_DIR = Path('data/processed')
+TABLES = {
+    'clean_patients': ['id', 'age'],
+    'clean_conditions': ['PATIENT', 'CODE'],
+    'clean_observations': ['PATIENT', 'CODE', 'VALUE_NUM'],
+    'clean_medications': ['PATIENT', 'CODE'],
+    'clean_encounters': ['PATIENT', 'START'],
+}
+
+def _measure_read(path, columns):
+    """Runs in a fresh worker so ru_maxrss reflects this read only; peak RSS is None without resource"""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    start = time.perf_counter()
+    df = read_file(path, columns)
+    elapsed = time.perf_counter() - start
+    if resource is None:
+        return elapsed, None, len(df)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, (rss_after - rss_before) / 1024, len(df)
+
+def measure_read(path, columns=None):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_measure_read, path, columns).result()
+
+def benchmark_table(name, columns, work_dir):
+    df = read_table(name, output_dir=OUTPUT_DIR)
+    csv_path = Path(work_dir) / f'{name}.csv'
+    df.to_csv(csv_path, index=False)
+    parquet_path = write_table(df, name, work_dir)
+
+    rows = []
+    for fmt, path in [('csv', csv_path), ('parquet', parquet_path)]:
+        for label, cols in [('all', None), ('projected', columns)]:
+            seconds, peak_mb, n = measure_read(path, cols)
+            rows.append({
+                'table': name, 'format': fmt, 'columns': label, 'rows': n,
+                'size_mb': path.stat().st_size / 1e6,
+                'read_s': seconds, 'peak_rss_mb': peak_mb,
+            })
+    return rows
+
+if __name__ == "__main__":
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, columns in TABLES.items():
+            if not (OUTPUT_DIR / f'{name}.parquet').exists() and not (OUTPUT_DIR / f'{name}.csv').exists():
+                print(f"Skipping {name}: not found in {OUTPUT_DIR}")
+                continue
+            results.extend(benchmark_table(name, columns, work_dir))
+
+    report = pd.DataFrame(results)
+    print("\n=== CSV vs Parquet store ===")
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    report.to_csv(OUTPUT_DIR / 'store_benchmark.csv', index=False)
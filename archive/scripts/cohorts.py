@@ -0,0 +1,81 @@
+# cohorts.py
+# Cohort definitions as named code sets, evaluated in one vectorized pass over
+# clean_conditions into a per-patient phenotype table: for each phenotype a
+# boolean flag and the onset date (first START of any of its codes).
+
+import pandas as pd
+from pathlib import Path
+from store import read_table, table_path, write_table
+import terminology
+
+OUTPUT_DIR = Path('data/processed')
+
+# Phenotype name -> SNOMED-CT condition codes; add one here and re-run the stage
+PHENOTYPES = {
+    'hypertension': ['59621000'],  # Hypertension
+}
+
+def code_map(phenotypes=PHENOTYPES):
+    """Long (CODE, PHENOTYPE) frame; a code may belong to several phenotypes"""
+    return pd.DataFrame(
+        [(code, name) for name, codes in phenotypes.items() for code in codes],
+        columns=['CODE', 'PHENOTYPE'],
+    )
+
+def build_phenotypes(conditions, patients, phenotypes=PHENOTYPES):
+    """
+    Per-patient phenotype table with one row per patient in `patients` and columns
+    <name> (bool) and <name>_onset (first diagnosis date) for every phenotype.
+    """
+    matches = conditions[['PATIENT', 'START', 'CODE']].merge(code_map(phenotypes), on='CODE')
+    onset = (matches.groupby(['PATIENT', 'PHENOTYPE'], sort=False)['START'].min()
+                    .unstack('PHENOTYPE')
+                    .reindex(columns=list(phenotypes)))
+
+    table = pd.DataFrame({'PATIENT': pd.unique(patients)})
+    for name in phenotypes:
+        table[f'{name}_onset'] = table['PATIENT'].map(onset[name])
+        table[name] = table['PATIENT'].isin(matches.loc[matches['PHENOTYPE'] == name, 'PATIENT'])
+    return table[['PATIENT'] + [c for name in phenotypes for c in (name, f'{name}_onset')]]
+
+def build_from_store(output_dir=OUTPUT_DIR, phenotypes=PHENOTYPES):
+    """Read only the phenotype codes of clean_conditions and build the table"""
+    codes = code_map(phenotypes)['CODE'].unique().tolist()
+    conditions = pd.read_parquet(
+        table_path('clean_conditions', output_dir),
+        columns=['PATIENT', 'START', 'CODE'],
+        filters=[('CODE', 'in', codes)],
+    )
+    patients = read_table('clean_patients', columns=['id'], output_dir=output_dir)['id']
+    return build_phenotypes(conditions, patients, phenotypes)
+
+def load_phenotypes(output_dir=OUTPUT_DIR):
+    """The cached phenotype table, rebuilt if clean_conditions is newer"""
+    path = table_path('phenotypes', output_dir)
+    source = table_path('clean_conditions', output_dir)
+    if not path.exists() or source.stat().st_mtime_ns > path.stat().st_mtime_ns:
+        write_table(build_from_store(output_dir), 'phenotypes', output_dir)
+    return read_table('phenotypes', output_dir=output_dir)
+
+def cohort(name, phenotypes_table=None):
+    """Patient IDs with the given phenotype"""
+    table = load_phenotypes() if phenotypes_table is None else phenotypes_table
+    return table.loc[table[name], 'PATIENT']
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: build and persist the phenotype table, return the report counts"""
+    table = build_from_store(output_dir)
+    write_table(table, 'phenotypes', output_dir)
+    counts = {'patients': len(table)}
+    counts.update({name: int(table[name].sum()) for name in PHENOTYPES})
+    return counts
+
+def report(counts):
+    print("### Phenotype Report")
+    print(f"Patients: {counts['patients']:,}")
+    for name, codes in PHENOTYPES.items():
+        descriptions = ', '.join(str(d) for d in terminology.describe('snomed', codes))
+        print(f"{name} ({descriptions}): {counts.get(name, 0):,} patients")
+
+if __name__ == "__main__":
+    report(run_stage())
@@ -0,0 +1,126 @@
+# density.py
+# Density grids of the vitals used by the BP/BMI analyses (07-09).
+# Each vital is binned onto a fixed grid in one pass (linear binning), and the
+# Gaussian KDE is the binned counts convolved with the kernel by FFT. That is linear
+# in the number of readings plus O(g log g) in the grid size, so every reading is
+# used and nothing is downsampled. The grids (histogram counts and KDE, per vital
+# and per phenotype member/non-member) are persisted in the store, so plots and
+# cohort comparisons read a few thousand rows instead of rescanning observations.
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from store import read_table, table_path, write_table
+from vitals import load_vitals
+from cohorts import PHENOTYPES, cohort, load_phenotypes
+
+OUTPUT_DIR = Path('data/processed')
+
+# Vital -> grid range; readings outside it are left out of the grid and counted
+GRIDS = {
+    'SYSTOLIC_BP': (40.0, 260.0),
+    'DIASTOLIC_BP': (20.0, 160.0),
+    'BMI': (10.0, 80.0),
+}
+GRID_POINTS = 2048
+KERNEL_REACH = 5        # kernel truncated at this many bandwidths
+VISIBLE_DENSITY = 1e-3  # plotted curves are trimmed where the density is below this share of the peak
+
+def grid(vital, points=GRID_POINTS):
+    lo, hi = GRIDS[vital]
+    return np.linspace(lo, hi, points)
+
+def _positions(values, vital, points=GRID_POINTS):
+    """Fractional grid positions of the readings inside the grid"""
+    lo, hi = GRIDS[vital]
+    pos = (np.asarray(values, dtype=np.float64) - lo) / ((hi - lo) / (points - 1))
+    return pos[(pos >= 0) & (pos <= points - 1)]
+
+def linear_binning(pos, points=GRID_POINTS):
+    """Each reading's weight split between its two neighbouring grid points"""
+    left = np.minimum(np.floor(pos).astype(np.int64), points - 2)
+    frac = pos - left
+    return np.bincount(left, 1 - frac, points) + np.bincount(left + 1, frac, points)
+
+def scott_bandwidth(values):
+    """Scott's rule, as used by scipy's gaussian_kde and seaborn's kdeplot"""
+    values = np.asarray(values, dtype=np.float64)
+    return values.std(ddof=1) * len(values) ** -0.2 if len(values) > 1 else np.nan
+
+def fft_kde(weights, delta, bandwidth):
+    """Gaussian KDE on the grid of binned weights, by FFT convolution with the kernel"""
+    points = len(weights)
+    reach = min(points - 1, int(np.ceil(KERNEL_REACH * bandwidth / delta)))
+    offsets = np.arange(-reach, reach + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    size = 1 << int(np.ceil(np.log2(points + 2 * reach)))  # no wrap-around
+    convolved = np.fft.irfft(np.fft.rfft(weights, size) * np.fft.rfft(kernel, size), size)
+    return np.maximum(convolved[reach:reach + points], 0) / weights.sum()
+
+def density_grid(values, vital, points=GRID_POINTS):
+    """Histogram counts and KDE of one sample of a vital on its grid"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    pos = _positions(values, vital, points)
+    x = grid(vital, points)
+    bandwidth = scott_bandwidth(values)
+    usable = len(pos) > 1 and bandwidth > 0
+    return pd.DataFrame({
+        'X': x,
+        'COUNT': np.bincount(np.rint(pos).astype(np.int64), minlength=points),
+        'DENSITY': fft_kde(linear_binning(pos, points), x[1] - x[0], bandwidth) if usable else np.nan,
+        'N': len(values),
+        'OUTSIDE': len(values) - len(pos),
+        'BANDWIDTH': bandwidth,
+    })
+
+def build_densities(output_dir=OUTPUT_DIR, phenotypes=PHENOTYPES, vitals=GRIDS):
+    """Grids of every vital for the members and non-members of every phenotype"""
+    wide = load_vitals(columns=['PATIENT', *vitals], output_dir=output_dir)
+    table = load_phenotypes(output_dir)
+    frames = []
+    for name in phenotypes:
+        member = wide['PATIENT'].isin(cohort(name, table)).to_numpy()
+        for vital in vitals:
+            values = wide[vital].to_numpy(dtype=np.float64)
+            for flag in (True, False):
+                frame = density_grid(values[member == flag], vital)
+                frame.insert(0, 'MEMBER', flag)
+                frame.insert(0, 'COHORT', name)
+                frame.insert(0, 'VITAL', vital)
+                frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def load_densities(output_dir=OUTPUT_DIR):
+    """The persisted density grids, rebuilt if the vitals or phenotypes are newer"""
+    path = table_path('densities', output_dir)
+    sources = [table_path(name, output_dir) for name in ['vitals', 'phenotypes']]
+    if not path.exists() or any(s.exists() and s.stat().st_mtime_ns > path.stat().st_mtime_ns for s in sources):
+        write_table(build_densities(output_dir), 'densities', output_dir)
+    return read_table('densities', output_dir=output_dir)
+
+def density_curve(densities, vital, cohort_name='hypertension', member=True):
+    """(x, density) of one vital and group, trimmed to where the curve is visible"""
+    rows = densities[(densities['VITAL'] == vital) & (densities['COHORT'] == cohort_name)
+                     & (densities['MEMBER'] == member)]
+    x, density = rows['X'].to_numpy(), rows['DENSITY'].to_numpy()
+    visible = np.flatnonzero(density > VISIBLE_DENSITY * np.nanmax(density, initial=0))
+    if len(visible) == 0:
+        return x[:0], density[:0]
+    return x[visible[0]:visible[-1] + 1], density[visible[0]:visible[-1] + 1]
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: build and persist the density grids, return the report counts"""
+    densities = build_densities(output_dir)
+    write_table(densities, 'densities', output_dir)
+    summary = densities.groupby(['COHORT', 'VITAL', 'MEMBER'], sort=False)[['N']].first()
+    return {f"{cohort_name}/{vital}/{'member' if member else 'other'}": int(row['N'])
+            for (cohort_name, vital, member), row in summary.iterrows()}
+
+def report(counts):
+    print("### Density Grids Report")
+    for key, n in counts.items():
+        print(f"{key}: {n:,} readings")
+
+if __name__ == "__main__":
+    report(run_stage())
@@ -0,0 +1,61 @@
+# encoding.py
+# Compact in-memory representation for the observation-scale tables.
+# PATIENT UUIDs become positions in a shared patient index (int32) and codes
+# and low-cardinality text become categoricals; expand() maps both back.
+
+import numpy as np
+import pandas as pd
+from patient_index import build_patient_index
+
+# Columns holding patient UUIDs (raw exports use PATIENT, patients uses Id/id)
+PATIENT_COLUMNS = ['PATIENT', 'Id', 'id']
+
+# Codes and low-cardinality fields stored as categoricals
+CATEGORY_COLUMNS = [
+    'CODE', 'DESCRIPTION', 'REASONCODE', 'UNITS', 'CATEGORY', 'TYPE', 'ENCOUNTERCLASS',
+    'race', 'gender', 'ethnicity', 'RACE', 'GENDER', 'ETHNICITY',
+]
+
+def shared_patient_index(*columns):
+    """One patient index covering every given PATIENT column, so no row encodes to -1"""
+    return build_patient_index(pd.concat([pd.Series(c, dtype=object) for c in columns], ignore_index=True))
+
+def encode_patients(values, patient_index):
+    """Dense int32 position of each patient in the index; -1 for patients not in it"""
+    return build_patient_index(patient_index).get_indexer(values).astype(np.int32)
+
+def decode_patients(codes, patient_index):
+    """Inverse of encode_patients; -1 maps back to NaN"""
+    codes = np.asarray(codes)
+    ids = build_patient_index(patient_index).take(np.where(codes < 0, 0, codes)).to_numpy(dtype=object)
+    ids[codes < 0] = np.nan
+    return ids
+
+def compact(df, patient_index=None):
+    """Return a copy with patient columns int-coded and code columns categorical"""
+    df = df.copy()
+    if patient_index is not None:
+        for col in PATIENT_COLUMNS:
+            if col in df.columns and df[col].dtype == object:
+                df[col] = encode_patients(df[col], patient_index)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    return df
+
+def expand(df, patient_index=None):
+    """Map a compacted frame back to the original UUID and string values"""
+    df = df.copy()
+    if patient_index is not None:
+        for col in PATIENT_COLUMNS:
+            if col in df.columns and df[col].dtype == np.int32:
+                df[col] = decode_patients(df[col], patient_index)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df
+
+def memory_report(before, after):
+    """One-line comparison of the deep memory footprint of two frames"""
+    b, a = before.memory_usage(deep=True).sum(), after.memory_usage(deep=True).sum()
+    return f"{b / 1e6:.1f} MB -> {a / 1e6:.1f} MB ({b / max(a, 1):.1f}x smaller)"
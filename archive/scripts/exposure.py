@@ -0,0 +1,152 @@
+# exposure.py
+# Medication exposure intervals and the treated/untreated flag of the BP/BMI analyses.
+# clean_medications courses (START/STOP) are grouped by drug class (named RxNorm code
+# sets) or by code, and each patient's overlapping courses are merged into disjoint
+# exposure intervals with one sort and a running maximum of STOP; a missing STOP is an
+# ongoing course. Since a patient's intervals of one group are disjoint and sorted, the
+# only interval that can contain a time t is the last one starting at or before t, so
+# point-in-time and overlap queries are an as-of join (pd.merge_asof): O(n log n) in
+# readings plus intervals, instead of a merge of every reading with every course.
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from store import read_table, table_path, write_table
+
+OUTPUT_DIR = Path('data/processed')
+
+# Drug class -> RxNorm codes; add one here and re-run the stage
+DRUG_CLASSES = {
+    'antihypertensive': [
+        '314076', '314077', '833036',  # ACE inhibitors: lisinopril, captopril
+        '979485', '979492',            # ARB: losartan
+        '1656354',                     # ARB/neprilysin: sacubitril/valsartan
+        '308136', '197361', '897718',  # Calcium channel blockers: amlodipine, verapamil
+        '310798',                      # Thiazide: hydrochlorothiazide
+        '200033',                      # Beta blocker: carvedilol
+    ],
+}
+
+# Courses of a group starting within this long after the previous one ends are merged
+MERGE_GAP = '0D'
+
+# Interval end of an ongoing course (STOP is NaT) and NaT itself, as int64 nanoseconds
+OPEN_END = np.iinfo(np.int64).max
+NAT = np.iinfo(np.int64).min
+
+def class_map(classes=DRUG_CLASSES):
+    """Long (CODE, CLASS) frame; a code may belong to several classes"""
+    return pd.DataFrame(
+        [(code, name) for name, codes in classes.items() for code in codes],
+        columns=['CODE', 'CLASS'],
+    )
+
+def _nanoseconds(values):
+    return pd.DatetimeIndex(values).asi8
+
+def merge_intervals(courses, by='CLASS', gap=MERGE_GAP):
+    """
+    Merge each patient's courses of each `by` group into disjoint exposure intervals.
+    Returns PATIENT, <by>, START, STOP (NaT if ongoing) and COURSES (courses merged).
+    """
+    courses = courses.dropna(subset=['START']).sort_values(['PATIENT', by, 'START'])
+    start = _nanoseconds(courses['START'])
+    stop = _nanoseconds(courses['STOP'])
+    stop = np.where(courses['STOP'].isna().to_numpy(), OPEN_END, np.maximum(stop, start))
+
+    # A course opens a new interval unless it starts before everything earlier in its group has ended
+    keys = [courses['PATIENT'].to_numpy(), courses[by].to_numpy()]
+    reach = pd.Series(stop).groupby(keys, sort=False).cummax().to_numpy()
+    first = np.ones(len(courses), dtype=bool)
+    first[1:] = (keys[0][1:] != keys[0][:-1]) | (keys[1][1:] != keys[1][:-1])
+    previous = np.concatenate([[OPEN_END], reach[:-1]])
+    opens = first | (start - pd.Timedelta(gap).value > previous)
+    interval = np.cumsum(opens) - 1
+
+    ends = np.maximum.reduceat(reach, np.flatnonzero(opens)) if len(courses) else reach
+    return pd.DataFrame({
+        'PATIENT': keys[0][opens],
+        by: keys[1][opens],
+        'START': pd.to_datetime(start[opens], utc=True),
+        'STOP': pd.to_datetime(np.where(ends == OPEN_END, NAT, ends), utc=True),
+        'COURSES': np.bincount(interval, minlength=int(opens.sum())),
+    })
+
+def build_exposures(output_dir=OUTPUT_DIR, classes=DRUG_CLASSES):
+    """Read only the class codes of clean_medications and merge them into intervals"""
+    codes = class_map(classes)
+    courses = pd.read_parquet(
+        table_path('clean_medications', output_dir),
+        columns=['PATIENT', 'START', 'STOP', 'CODE'],
+        filters=[('CODE', 'in', codes['CODE'].unique().tolist())],
+    )
+    return merge_intervals(courses.merge(codes, on='CODE'), by='CLASS')
+
+def load_exposures(output_dir=OUTPUT_DIR):
+    """The persisted exposure intervals, rebuilt if clean_medications is newer"""
+    path = table_path('exposures', output_dir)
+    source = table_path('clean_medications', output_dir)
+    if not path.exists() or source.stat().st_mtime_ns > path.stat().st_mtime_ns:
+        write_table(build_exposures(output_dir), 'exposures', output_dir)
+    return read_table('exposures', output_dir=output_dir)
+
+def _interval_ends(intervals):
+    return np.where(intervals['STOP'].isna().to_numpy(), OPEN_END, _nanoseconds(intervals['STOP']))
+
+def _last_interval_end(patients, times, intervals, strictly_before):
+    """
+    For each (patient, int64 ns time), the end of the patient's last interval starting at
+    or before (or strictly before) the time: OPEN_END if ongoing, NAT if there is none or
+    the time is NaT. Intervals must be disjoint per patient, as merge_intervals gives them.
+    """
+    valid = times != NAT
+    left = pd.DataFrame({'PATIENT': np.asarray(patients)[valid], 'T': times[valid],
+                         'ROW': np.flatnonzero(valid)}).sort_values('T', kind='stable')
+    right = pd.DataFrame({'PATIENT': intervals['PATIENT'].to_numpy(), 'T': _nanoseconds(intervals['START']),
+                          'INTERVAL': np.arange(len(intervals))}).sort_values('T', kind='stable')
+    joined = pd.merge_asof(left, right, on='T', by='PATIENT', direction='backward',
+                           allow_exact_matches=not strictly_before)
+
+    found = joined['INTERVAL'].notna().to_numpy()
+    ends = np.full(len(times), NAT)
+    ends[joined['ROW'].to_numpy()[found]] = _interval_ends(intervals)[joined['INTERVAL'].to_numpy()[found].astype(np.int64)]
+    return ends
+
+def exposed_at(events, intervals, time='DATE'):
+    """Whether each event's time falls in one of its patient's intervals [START, STOP)"""
+    times = _nanoseconds(events[time])
+    return times < _last_interval_end(events['PATIENT'].to_numpy(), times, intervals, strictly_before=False)
+
+def exposed_during(events, intervals, start='START', stop='STOP'):
+    """Whether each event's window [start, stop) overlaps one of its patient's intervals; NaT stop is open"""
+    stops = _nanoseconds(events[stop])
+    stops = np.where(stops == NAT, OPEN_END, stops)
+    ends = _last_interval_end(events['PATIENT'].to_numpy(), stops, intervals, strictly_before=True)
+    starts = _nanoseconds(events[start])
+    return (starts != NAT) & (starts < ends)
+
+def treated(events, drug_class='antihypertensive', exposures=None, time='DATE'):
+    """Treated/untreated flag of each event row: exposed to the class at its time"""
+    exposures = load_exposures() if exposures is None else exposures
+    return exposed_at(events, exposures[exposures['CLASS'] == drug_class], time)
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: build and persist the exposure intervals, return the report counts"""
+    exposures = build_exposures(output_dir)
+    write_table(exposures, 'exposures', output_dir)
+    counts = {}
+    for name in DRUG_CLASSES:
+        rows = exposures[exposures['CLASS'] == name]
+        counts[name] = {'intervals': len(rows), 'patients': rows['PATIENT'].nunique(),
+                        'courses': int(rows['COURSES'].sum())}
+    return counts
+
+def report(counts):
+    print("### Medication Exposure Report")
+    for name, codes in DRUG_CLASSES.items():
+        c = counts.get(name, {'intervals': 0, 'patients': 0, 'courses': 0})
+        print(f"{name} ({len(codes)} RxNorm codes): {c['courses']:,} courses merged into "
+              f"{c['intervals']:,} intervals for {c['patients']:,} patients")
+
+if __name__ == "__main__":
+    report(run_stage())
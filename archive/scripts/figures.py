@@ -0,0 +1,123 @@
+# figures.py
+# Figure rendering for the analysis scripts 07-09, kept off their import path.
+# Scripts describe each figure as data (density curves precomputed by density.py,
+# title, labels) and hand it to `density_figure`. matplotlib is imported only when a
+# figure is rendered:
+#   show  - interactive windows (the default where a display is available)
+#   files - PNGs in data/processed/figures/, rendered off-screen by worker processes
+#           while the script carries on with its numeric work (the default headless)
+#   none  - statistics only; no plotting library is imported
+# The mode comes from the PLOTS environment variable or the scripts' --plots flag.
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Configuration
+FIGURE_DIR = Path('data/processed/figures')
+MODES = ['show', 'files', 'none']
+DPI = 120
+RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))  # leave a core to the script
+
+_MODE = None
+_POOL = None
+_PENDING = []
+
+def default_mode():
+    """PLOTS if set, else show with a display and files without one (batch jobs)"""
+    if os.environ.get('PLOTS'):
+        return os.environ['PLOTS']
+    interactive = (sys.platform in ('darwin', 'win32')
+                   or os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return 'show' if interactive else 'files'
+
+def set_mode(mode=None):
+    """Choose the plot mode; files mode starts the render workers right away"""
+    global _MODE
+    mode = mode or default_mode()
+    if mode not in MODES:
+        raise ValueError(f"Unknown plot mode {mode!r}; choose from {MODES}")
+    _MODE = mode
+    if mode == 'files':
+        _render_pool()
+    return mode
+
+def plot_mode():
+    return _MODE or set_mode()
+
+def add_argument(parser):
+    """--plots option for the analysis scripts"""
+    parser.add_argument('--plots', choices=MODES, default=None,
+                        help="show figures, write them to files, or skip them (default: PLOTS or auto)")
+
+def _draw(ax, spec):
+    for label, x, density, color in spec['curves']:
+        line, = ax.plot(x, density, label=label, color=color)
+        if spec['fill']:
+            ax.fill_between(x, density, color=line.get_color(), alpha=0.25, linewidth=0)
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel(spec['ylabel'])
+    if any(curve[0] for curve in spec['curves']):
+        ax.legend()
+
+def _import_plotting():
+    import matplotlib.figure
+
+def _render_pool():
+    """Workers import the plotting libraries while the script loads its data"""
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_import_plotting)
+        for _ in range(RENDER_WORKERS):
+            _POOL.submit(int)  # start the workers now, not at the first figure
+    return _POOL
+
+def _render_file(spec, path):
+    """Off-screen render in a worker; the Figure API needs no pyplot or display"""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=spec['figsize'])
+    _draw(fig.subplots(), spec)
+    fig.tight_layout()
+    fig.savefig(path, dpi=DPI)
+    return path
+
+def _show(spec):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=spec['figsize'])
+    _draw(ax, spec)
+    fig.tight_layout()
+    plt.show()
+
+def density_figure(name, curves, title, xlabel, ylabel='Density', fill=False, figsize=(8, 5),
+                   figure_dir=FIGURE_DIR):
+    """
+    Plot of one or more density curves; curves are (label, x, density, color) tuples.
+    Returns the PNG path in files mode, else None.
+    """
+    mode = plot_mode()
+    if mode == 'none':
+        return None
+    spec = {'curves': [tuple(curve) for curve in curves], 'title': title,
+            'xlabel': xlabel, 'ylabel': ylabel, 'fill': fill, 'figsize': figsize}
+    if mode == 'show':
+        _show(spec)
+        return None
+
+    path = Path(figure_dir) / f'{name}.png'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _PENDING.append(_render_pool().submit(_render_file, spec, path))
+    return path
+
+def finish():
+    """Wait for the figures still rendering and return their paths"""
+    global _POOL
+    paths = [future.result() for future in _PENDING]
+    _PENDING.clear()
+    if _POOL is not None:
+        _POOL.shutdown()
+        _POOL = None
+    for path in paths:
+        print(f"Figure written to {path}")
+    return paths
@@ -0,0 +1,191 @@
+# incremental.py
+# Incremental cleaning for new Synthea drops.
+# A raw table is read in content-defined row blocks: a block ends after a row
+# picked by the hash of its values, so an inserted or deleted row changes only the
+# block holding it instead of shifting every later block. Each block is keyed by a
+# hash of its content, of which of its rows link to a valid patient, and of the
+# stage's code and dictionaries. Cleaned blocks are kept as content-addressed partitions
+# under data/processed/partitions, and a manifest per stage under
+# data/processed/manifests records the input hashes, row ranges and partitions.
+# On the next run only blocks whose key changed are cleaned; the partitions are
+# then concatenated into the stage's cleaned table.
+
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from store import table_path, write_chunks, write_table
+from loader import iter_table
+from ingest import blocked_dir
+from patient_index import build_patient_index, linked
+from telemetry import iter_step, step
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+BLOCK_ROWS = 100_000
+HASH_CACHE = 'input_hashes.json'
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_dir(output_dir=OUTPUT_DIR):
+    return Path(output_dir) / 'manifests'
+
+def partition_dir(table, output_dir=OUTPUT_DIR):
+    return Path(output_dir) / 'partitions' / table
+
+def _read_json(path):
+    return json.loads(path.read_text()) if path.exists() else {}
+
+def _write_json(data, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data, indent=2))
+    tmp.replace(path)
+
+def input_digest(path, output_dir=OUTPUT_DIR):
+    """Content hash of an input file, re-hashed only when its size or mtime changed"""
+    path = Path(path)
+    cache_path = manifest_dir(output_dir) / HASH_CACHE
+    cache = _read_json(cache_path)
+    stat = path.stat()
+    entry = cache.get(str(path))
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256']
+    cache[str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_digest(path)}
+    _write_json(cache, cache_path)
+    return cache[str(path)]['sha256']
+
+def block_digest(frame):
+    """Hash of a block's column names and values"""
+    digest = hashlib.sha256(','.join(frame.columns).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def content_blocks(chunks, block_rows=BLOCK_ROWS):
+    """
+    Re-cut a stream of frames into blocks of about block_rows rows. A block ends after a
+    row whose hash is 0 modulo the cut period, once it holds at least block_rows // 4
+    rows, and after 4 * block_rows rows at the latest. The same rows give the same cuts
+    wherever they sit in the table. A table without rows is one empty block, so the stage
+    still writes its (empty) outputs and reports zeroed counts.
+    """
+    min_rows, max_rows = block_rows // 4, 4 * block_rows
+    period = max(block_rows - min_rows, 1)
+    pending, open_rows, empty, yielded = [], 0, None, False
+    for chunk in chunks:
+        if empty is None:
+            empty = chunk.iloc[:0]
+        marks = np.flatnonzero(pd.util.hash_pandas_object(chunk, index=False).to_numpy() % period == 0) + 1
+        pos = 0
+        while pos < len(chunk):
+            first = np.searchsorted(marks, pos + max(min_rows - open_rows, 1))
+            limit = pos + max_rows - open_rows
+            cut = min(marks[first], limit) if first < len(marks) else limit
+            if cut > len(chunk):
+                pending.append(chunk.iloc[pos:])
+                open_rows += len(chunk) - pos
+                break
+            pending.append(chunk.iloc[pos:cut])
+            yield pending[0] if len(pending) == 1 else pd.concat(pending)
+            pending, open_rows, pos, yielded = [], 0, cut, True
+    if pending:
+        yield pending[0] if len(pending) == 1 else pd.concat(pending)
+    elif not yielded and empty is not None:
+        yield empty
+
+def mask_digest(mask):
+    return hashlib.sha256(np.packbits(np.asarray(mask, dtype=bool)).tobytes()).hexdigest()
+
+def load_manifest(stage, output_dir=OUTPUT_DIR):
+    return _read_json(manifest_dir(output_dir) / f'{stage}.json')
+
+def save_manifest(stage, manifest, output_dir=OUTPUT_DIR):
+    _write_json(manifest, manifest_dir(output_dir) / f'{stage}.json')
+
+def _serializable(counts):
+    """Block counts for the manifest: ints as they are, anything else as its distinct values"""
+    return {
+        key: int(value) if np.isscalar(value) else sorted(pd.Series(value).dropna().astype(str).unique())
+        for key, value in counts.items()
+    }
+
+def merge_counts(block_counts):
+    """
+    Combine per-block counts: ints are summed, distinct-value lists are unioned and counted.
+    Every table has at least one block (content_blocks), so every report key is present.
+    """
+    merged = {}
+    for key in dict.fromkeys(k for counts in block_counts for k in counts):
+        values = [counts[key] for counts in block_counts if key in counts]
+        if all(isinstance(v, int) for v in values):
+            merged[key] = sum(values)
+        else:
+            merged[key] = len(set().union(*values))
+    return merged
+
+def run_incremental(stage, module, valid_patients, outputs, context, inputs,
+                    data_dir, output_dir=OUTPUT_DIR, block_rows=BLOCK_ROWS):
+    """
+    Clean the raw table `stage` block by block with module.clean_block(raw, valid_patients,
+    data_dir, output_dir), reusing the partitions of blocks whose key is in the previous
+    manifest, and rebuild each of `outputs` from its partitions if any changed. clean_block returns one frame, or a
+    dict of frames for stages with several outputs (e.g. a quarantine table).
+    Returns the merged report counts.
+    """
+    manifest = load_manifest(stage, output_dir)
+    previous = {block['key']: block for block in manifest.get('blocks', [])}
+    parts = {output: partition_dir(output, output_dir) for output in outputs}
+    for directory in parts.values():
+        directory.mkdir(parents=True, exist_ok=True)
+    valid_patients = build_patient_index(valid_patients)
+
+    blocks, cleaned, start = [], 0, 0
+    for raw in iter_step('load', content_blocks(iter_table(stage, block_rows, data_dir=data_dir,
+                                                           block_dir=blocked_dir(output_dir)), block_rows)):
+        key = hashlib.sha256(
+            f"{context}:{block_digest(raw)}:{mask_digest(linked(raw['PATIENT'], valid_patients))}".encode()
+        ).hexdigest()
+        block = previous.get(key)
+        if block is None or not all((parts[o] / block['partition']).exists() for o in outputs):
+            frames, counts = module.clean_block(raw, valid_patients, data_dir, output_dir)
+            if not isinstance(frames, dict):
+                frames = {outputs[0]: frames}
+            for output in outputs:
+                partition = write_table(frames[output], f'part-{key[:20]}', parts[output]).name
+            block = {'key': key, 'partition': partition, 'counts': _serializable(counts)}
+            cleaned += 1
+        blocks.append({**block, 'rows': [start, start + len(raw)]})
+        start += len(raw)
+
+    # Concatenate the partitions in row order when the set changed or an output was touched
+    partitions = [block['partition'] for block in blocks]
+    changed = partitions != [block['partition'] for block in manifest.get('blocks', [])]
+    mtimes = manifest.get('output_mtime_ns')
+    mtimes = dict(mtimes) if isinstance(mtimes, dict) else {}  # older manifests kept a single mtime
+    for output in outputs:
+        path = table_path(output, output_dir)
+        if changed or not path.exists() or path.stat().st_mtime_ns != mtimes.get(output):
+            with step('write') as s:
+                s['bytes'] = write_chunks((pd.read_parquet(parts[output] / p) for p in partitions), output,
+                                          output_dir).stat().st_size
+        mtimes[output] = path.stat().st_mtime_ns
+
+        for stale in set(p.name for p in parts[output].glob('*.parquet')) - set(partitions):
+            (parts[output] / stale).unlink()
+
+    print(f"[{stage}] incremental: cleaned {cleaned} of {len(blocks)} blocks ({start:,} rows)")
+    save_manifest(stage, {
+        'inputs': inputs,
+        'context': context,
+        'block_rows': block_rows,
+        'outputs': outputs,
+        'output_mtime_ns': mtimes,
+        'blocks': blocks,
+    }, output_dir)
+    return merge_counts([block['counts'] for block in blocks])
@@ -0,0 +1,149 @@
+# ingest.py
+# Blocked re-encoding of the raw Synthea exports for parallel and random-access reads.
+# The exports are single-stream gzip: one zlib thread inflates the whole file before
+# any row is parsed, and row N can only be reached by inflating everything before it.
+# This stage rewrites each export once, under data/processed/blocked/, as a series of
+# independent gzip members of about BLOCK_BYTES of whole CSV records (the header line
+# is a member of its own). Concatenated members are still one valid gzip of the same
+# CSV, so zcat and pandas read the file as before. A JSON index next to it lists each
+# member's byte offset, length, first row and row count, so the loader can inflate and
+# parse several members at once and seek straight to a row range. The index records
+# the source file's size and mtime; an export that changed afterwards is read directly.
+
+import gzip
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Configuration
+DATA_DIR = Path('data/original')
+OUTPUT_DIR = Path('data/processed')
+BLOCK_DIR = OUTPUT_DIR / 'blocked'  # blocked_dir(OUTPUT_DIR)
+BLOCK_BYTES = 4 << 20  # uncompressed bytes per member
+COMPRESSLEVEL = 6
+WORKERS = os.cpu_count() or 1  # zlib releases the GIL, so threads compress in parallel
+
+RAW_FILES = ['patients.csv.gz', 'conditions.csv.gz', 'encounters.csv.gz', 'medications.csv.gz',
+             'observations.csv.gz']
+
+def blocked_dir(output_dir=OUTPUT_DIR):
+    """Where the ingest stage writes its blocked copies for a given output directory"""
+    return Path(output_dir) / 'blocked'
+
+def blocked_path(source, block_dir=BLOCK_DIR):
+    return Path(block_dir) / Path(source).name
+
+def index_path(source, block_dir=BLOCK_DIR):
+    return Path(block_dir) / f'{Path(source).name}.index.json'
+
+def _source_stamp(source):
+    stat = Path(source).stat()
+    return {'source': str(Path(source).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def count_records(piece):
+    """
+    Records in a piece that starts at a record boundary: its line breaks outside double
+    quotes. Splitting on quotes leaves the unquoted text at the even positions (an escaped
+    quote "" toggles twice, so it changes nothing).
+    """
+    if b'"' not in piece:
+        return piece.count(b'\n')
+    return sum(segment.count(b'\n') for segment in piece.split(b'"')[::2])
+
+def record_blocks(stream, block_bytes=BLOCK_BYTES):
+    """
+    Split an uncompressed byte stream into (piece, records) of about block_bytes that end
+    at a record boundary: a line break outside double quotes, so quoted line breaks stay put.
+    """
+    carry = b''
+    while True:
+        data = stream.read(block_bytes)
+        if not data:
+            break
+        data = carry + data
+        cut = data.rfind(b'\n') + 1
+        while cut and data.count(b'"', 0, cut) % 2:
+            cut = data.rfind(b'\n', 0, cut - 1) + 1
+        if cut == 0:  # no boundary yet; read on
+            carry = data
+            continue
+        carry = data[cut:]
+        yield data[:cut], count_records(data[:cut])
+    if carry:
+        carry = carry if carry.endswith(b'\n') else carry + b'\n'
+        yield carry, count_records(carry)
+
+def _compress(block):
+    piece, records = block
+    return gzip.compress(piece, compresslevel=COMPRESSLEVEL, mtime=0), records
+
+def encode(source, block_dir=BLOCK_DIR, block_bytes=BLOCK_BYTES, workers=WORKERS):
+    """Write the blocked copy of one export and its index; returns the index"""
+    target, index_file = blocked_path(source, block_dir), index_path(source, block_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    index_file.unlink(missing_ok=True)  # the index is written last and marks a complete copy
+    index = {**_source_stamp(source), 'block_bytes': block_bytes, 'rows': 0,
+             'offset': [], 'length': [], 'first_row': [], 'block_rows': []}
+
+    tmp = target.with_name(target.name + '.tmp')
+    with gzip.open(source, 'rb') as stream, open(tmp, 'wb') as out, ThreadPoolExecutor(workers) as pool:
+        header = stream.readline()
+        index['header'] = header.decode().rstrip('\r\n')
+        out.write(gzip.compress(header, compresslevel=COMPRESSLEVEL, mtime=0))
+
+        # Compress a window of pieces at a time, so memory stays at a few blocks per worker
+        pieces = record_blocks(stream, block_bytes)
+        while True:
+            window = [piece for _, piece in zip(range(2 * workers), pieces)]
+            if not window:
+                break
+            for member, rows in pool.map(_compress, window):
+                index['offset'].append(out.tell())
+                index['length'].append(len(member))
+                index['first_row'].append(index['rows'])
+                index['block_rows'].append(rows)
+                index['rows'] += rows
+                out.write(member)
+    tmp.replace(target)
+    index_file.write_text(json.dumps(index))
+    return index
+
+def load_index(source, block_dir=BLOCK_DIR):
+    """Block index of an export's blocked copy, or None if there is none or the export changed"""
+    path = index_path(source, block_dir)
+    if not path.exists() or not Path(source).exists():
+        return None
+    index = json.loads(path.read_text())
+    stamp = _source_stamp(source)
+    return index if all(index.get(k) == v for k, v in stamp.items()) else None
+
+def block_span(index, start=0, stop=None):
+    """Positions of the blocks holding rows [start, stop)"""
+    stop = index['rows'] if stop is None else min(stop, index['rows'])
+    first_row, block_rows = index['first_row'], index['block_rows']
+    return [i for i in range(len(first_row)) if first_row[i] < stop and first_row[i] + block_rows[i] > start]
+
+def read_block(source, index, block, block_dir=BLOCK_DIR):
+    """Uncompressed CSV bytes of one block (no header line)"""
+    with open(blocked_path(source, block_dir), 'rb') as f:
+        f.seek(index['offset'][block])
+        member = f.read(index['length'][block])
+    return zlib.decompress(member, wbits=31)
+
+def run_stage(data_dir=DATA_DIR, output_dir=OUTPUT_DIR, files=RAW_FILES):
+    """Pipeline stage: re-encode the given raw exports, return the report counts"""
+    counts = {}
+    for file in files:
+        index = encode(Path(data_dir) / file, blocked_dir(output_dir))
+        counts[file] = {'rows': index['rows'], 'blocks': len(index['offset'])}
+    return counts
+
+def report(counts):
+    print("### Ingest Report")
+    for file, c in counts.items():
+        print(f"{file}: {c['rows']:,} rows in {c['blocks']:,} independently compressed blocks")
+
+if __name__ == "__main__":
+    report(run_stage())
@@ -0,0 +1,271 @@
+# loader.py
+# One loading layer for the raw Synthea exports and terminology dictionaries.
+# Schemas follow docs/data_dictionary.md: UUIDs and codes are read as strings,
+# numerics as float64 and low-cardinality fields as categoricals, so nothing is
+# left to per-chunk type inference.
+# Exports re-encoded by the ingest stage (ingest.py) are read from their blocked copy:
+# LOAD_WORKERS threads inflate and parse independent blocks at once, and load_rows
+# inflates only the blocks holding the requested rows.
+
+import csv
+import io
+import os
+import pandas as pd
+import time
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+import ingest
+
+# Configuration
+DATA_DIR = Path('data/original')
+VERBOSE = True
+LOAD_WORKERS = os.cpu_count() or 1  # zlib and the C parser release the GIL, so threads overlap
+
+# Codes exported as floats by Synthea ("10509002.0") are stored without the suffix
+_FLOAT_SUFFIX = r'\.0$'
+_SCIENTIFIC = r'^\d(?:\.\d+)?[eE]\+\d+$'
+
+SCHEMAS = {
+    'patients': {
+        'file': 'patients.csv.gz',
+        'dtypes': {
+            'Id': str, 'BIRTHDATE': str, 'DEATHDATE': str, 'SSN': str, 'DRIVERS': str,
+            'PASSPORT': str, 'PREFIX': str, 'FIRST': str, 'LAST': str, 'SUFFIX': str,
+            'MAIDEN': str, 'MARITAL': str, 'RACE': str, 'ETHNICITY': str, 'GENDER': str,
+            'BIRTHPLACE': str, 'ADDRESS': str, 'CITY': str, 'STATE': str, 'COUNTY': str,
+            'FIPS': str, 'ZIP': str, 'LAT': 'float64', 'LON': 'float64',
+            'HEALTHCARE_EXPENSES': 'float64', 'HEALTHCARE_COVERAGE': 'float64', 'INCOME': 'float64',
+        },
+        'codes': ['ZIP', 'FIPS'],
+    },
+    'conditions': {
+        'file': 'conditions.csv.gz',
+        'dtypes': {
+            'START': str, 'STOP': str, 'PATIENT': str, 'ENCOUNTER': str, 'CODE': str,
+            'DESCRIPTION': str,
+        },
+        'codes': ['CODE'],
+    },
+    'encounters': {
+        'file': 'encounters.csv.gz',
+        'dtypes': {
+            'Id': str, 'START': str, 'STOP': str, 'PATIENT': str, 'ORGANIZATION': str,
+            'PROVIDER': str, 'PAYER': str, 'ENCOUNTERCLASS': 'category', 'CODE': str,
+            'DESCRIPTION': str, 'BASE_ENCOUNTER_COST': 'float64', 'TOTAL_CLAIM_COST': 'float64',
+            'PAYER_COVERAGE': 'float64', 'REASONCODE': str, 'REASONDESCRIPTION': str,
+        },
+        'codes': ['CODE', 'REASONCODE'],
+    },
+    'medications': {
+        'file': 'medications.csv.gz',
+        'dtypes': {
+            'START': str, 'STOP': str, 'PATIENT': str, 'PAYER': str, 'ENCOUNTER': str,
+            'CODE': str, 'DESCRIPTION': str, 'BASE_COST': 'float64', 'PAYER_COVERAGE': 'float64',
+            'DISPENSES': 'float64', 'TOTALCOST': 'float64', 'REASONCODE': str,
+            'REASONDESCRIPTION': str,
+        },
+        'codes': ['CODE', 'REASONCODE'],
+    },
+    'observations': {
+        'file': 'observations.csv.gz',
+        'dtypes': {
+            'DATE': str, 'PATIENT': str, 'ENCOUNTER': str, 'CATEGORY': 'category', 'CODE': str,
+            'DESCRIPTION': str, 'VALUE': str, 'UNITS': str, 'TYPE': 'category',
+        },
+        'codes': ['CODE'],
+    },
+    'dictionary_snomed': {
+        'file': 'dictionary_snomed.csv',
+        'dtypes': {'CODE': str, 'DESCRIPTION': str},
+        'codes': ['CODE'],
+    },
+    'dictionary_loinc': {
+        'file': 'dictionary_loinc.csv',
+        'dtypes': {'CODE': str, 'DESCRIPTION': str},
+        'codes': ['CODE'],
+    },
+    'dictionary_rxnorm': {
+        'file': 'dictionary_rxnorm.csv',
+        'dtypes': {'CODE': str, 'DESCRIPTION': str},
+        'codes': ['CODE'],
+    },
+}
+
+# One record per load: table, seconds, bytes read from disk, rows, in-memory bytes
+LOAD_STATS = []
+
+def _expand_scientific(code):
+    # Decimal parses the exported repr exactly, unlike float for codes above 2**53
+    return str(int(Decimal(code)))
+
+def normalize_codes(values):
+    """
+    Undo the float formatting of code strings: "10509002.0" -> "10509002" and
+    "1.0939881000119104e+16" -> "10939881000119104". Whitespace is stripped.
+    """
+    values = values.str.strip().str.replace(_FLOAT_SUFFIX, '', regex=True)
+    scientific = values.str.contains(_SCIENTIFIC, regex=True, na=False)
+    if scientific.any():
+        values = values.copy()
+        values[scientific] = values[scientific].map(_expand_scientific)
+    return values
+
+def table_path(name, data_dir=DATA_DIR):
+    return Path(data_dir) / SCHEMAS[name]['file']
+
+def _read_options(name, columns):
+    schema = SCHEMAS[name]
+    dtypes = schema['dtypes']
+    if columns is not None:
+        dtypes = {col: dtype for col, dtype in dtypes.items() if col in columns}
+    return {'usecols': columns, 'dtype': dtypes}
+
+def _apply_schema(df, name):
+    for col in SCHEMAS[name]['codes']:
+        if col in df.columns:
+            df[col] = normalize_codes(df[col])
+    return df
+
+def _categorize(df, name):
+    """Categoricals of a frame concatenated from blocks that were parsed as strings"""
+    categories = [col for col, dtype in SCHEMAS[name]['dtypes'].items() if dtype == 'category' and col in df.columns]
+    return df.assign(**{col: df[col].astype('category') for col in categories})
+
+def _block_options(name, columns, index):
+    """read_csv options of one headerless block; categories are set once the blocks are joined"""
+    options = _read_options(name, columns)
+    options['dtype'] = {col: str if dtype == 'category' else dtype for col, dtype in options['dtype'].items()}
+    return {**options, 'header': None, 'names': next(csv.reader([index['header']]))}
+
+def _parse_block(path, index, block, options, block_dir):
+    df = pd.read_csv(io.BytesIO(ingest.read_block(path, index, block, block_dir)), **options)
+    df.index = pd.RangeIndex(index['first_row'][block], index['first_row'][block] + len(df))
+    return df
+
+def _read_blocks(name, path, index, blocks, columns=None, block_dir=ingest.BLOCK_DIR):
+    """Parsed blocks in row order, LOAD_WORKERS at a time; at most twice that are held ahead"""
+    options = _block_options(name, columns, index)
+    blocks = iter(blocks)
+    with ThreadPoolExecutor(LOAD_WORKERS) as pool:
+        submit = lambda block: pool.submit(_parse_block, path, index, block, options, block_dir)
+        pending = deque(submit(block) for _, block in zip(range(2 * LOAD_WORKERS), blocks))
+        while pending:
+            frame = pending.popleft().result()
+            block = next(blocks, None)
+            if block is not None:
+                pending.append(submit(block))
+            yield frame
+
+def _rechunk(frames, chunksize):
+    """Regroup frames into chunks of chunksize rows, as read_csv(chunksize=...) yields them"""
+    buffer, rows = [], 0
+    for frame in frames:
+        buffer.append(frame)
+        rows += len(frame)
+        while rows >= chunksize:
+            joined = pd.concat(buffer)
+            yield joined.iloc[:chunksize]
+            buffer, rows = [joined.iloc[chunksize:]], rows - chunksize
+    if rows:
+        yield pd.concat(buffer)
+
+def _record(name, path, seconds, rows, memory, bytes_read=None):
+    """Record a load; bytes_read defaults to the whole file at path"""
+    stats = {
+        'table': name,
+        'seconds': seconds,
+        'bytes_read': path.stat().st_size if bytes_read is None else bytes_read,
+        'rows': rows,
+        'memory_bytes': int(memory),
+    }
+    LOAD_STATS.append(stats)
+    if VERBOSE:
+        print(f"[load] {name}: {rows:,} rows in {seconds:.2f}s, "
+              f"{stats['bytes_read'] / 1e6:.1f} MB read, {memory / 1e6:.1f} MB in memory")
+    return stats
+
+def _block_index(path, block_dir, parallel=False):
+    """
+    Index of the export's blocked copy if it is current and holds rows, else None. For
+    whole-table reads (parallel) only with several workers: on one core, handing blocks
+    to a thread costs more than reading the file straight through.
+    """
+    if parallel and LOAD_WORKERS < 2:
+        return None
+    index = ingest.load_index(path, block_dir)
+    return index if index is not None and index['rows'] else None
+
+def load_table(name, columns=None, data_dir=DATA_DIR, path=None, block_dir=ingest.BLOCK_DIR):
+    """
+    Load a raw table with its schema, reading only `columns` if given. block_dir is where
+    the ingest stage put the blocked copies (ingest.blocked_dir of the output directory).
+    """
+    path = Path(path) if path is not None else table_path(name, data_dir)
+    start = time.perf_counter()
+    index = _block_index(path, block_dir, parallel=True)
+    if index is None:
+        df = pd.read_csv(path, **_read_options(name, columns))
+    else:
+        blocks = range(len(index['offset']))
+        df = _categorize(pd.concat(_read_blocks(name, path, index, blocks, columns, block_dir)), name)
+    df = _apply_schema(df, name)
+    _record(name, path if index is None else ingest.blocked_path(path, block_dir), time.perf_counter() - start,
+            len(df), df.memory_usage(deep=True).sum())
+    return df
+
+def load_rows(name, start, stop, columns=None, data_dir=DATA_DIR, path=None, block_dir=ingest.BLOCK_DIR):
+    """
+    Load rows [start, stop) of a raw table (0 is the first row after the header). From a
+    blocked copy only the blocks holding them are inflated; otherwise the file is scanned.
+    """
+    path = Path(path) if path is not None else table_path(name, data_dir)
+    began = time.perf_counter()
+    index = _block_index(path, block_dir)
+    blocks = ingest.block_span(index, start, stop) if index is not None else []
+    if not blocks:
+        df = pd.read_csv(path, skiprows=range(1, start + 1), nrows=max(stop - start, 0),
+                         **_read_options(name, columns))
+        df.index = pd.RangeIndex(start, start + len(df))
+    else:
+        first = index['first_row'][blocks[0]]
+        df = pd.concat(_read_blocks(name, path, index, blocks, columns, block_dir))
+        df = _categorize(df.iloc[start - first:stop - first], name)
+    df = _apply_schema(df, name)
+    # A ranged read from the blocked copy reads only the members of its blocks
+    _record(name, path if not blocks else ingest.blocked_path(path, block_dir), time.perf_counter() - began,
+            len(df), df.memory_usage(deep=True).sum(),
+            bytes_read=sum(index['length'][block] for block in blocks) if blocks else None)
+    return df
+
+def iter_table(name, chunksize, columns=None, data_dir=DATA_DIR, path=None, block_dir=ingest.BLOCK_DIR):
+    """Yield a raw table in chunks with its schema; memory_bytes is the largest chunk"""
+    path = Path(path) if path is not None else table_path(name, data_dir)
+    seconds, rows, peak_memory = 0.0, 0, 0
+    index = _block_index(path, block_dir, parallel=True)
+    if index is None:
+        reader = pd.read_csv(path, chunksize=chunksize, **_read_options(name, columns))
+    else:
+        # Same chunk boundaries as the plain reader, so incremental block keys do not change
+        blocks = _read_blocks(name, path, index, range(len(index['offset'])), columns, block_dir)
+        reader = closing(_categorize(chunk, name) for chunk in _rechunk(blocks, chunksize))
+    with reader as chunks:
+        chunks = iter(chunks)
+        while True:
+            # Only time spent reading counts, not the consumer's work between chunks
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            chunk = _apply_schema(chunk, name)
+            seconds += time.perf_counter() - start
+            rows += len(chunk)
+            peak_memory = max(peak_memory, chunk.memory_usage(deep=True).sum())
+            yield chunk
+    _record(name, path if index is None else ingest.blocked_path(path, block_dir), seconds, rows, peak_memory)
+
+def load_report():
+    """Load stats of this process as a frame, one row per load"""
+    return pd.DataFrame(LOAD_STATS)
@@ -0,0 +1,118 @@
+# partitions.py
+# Patient-hash layout of the cleaned tables for per-patient joins.
+# Every table linked to patients is split into N_BUCKETS files by a stable hash of
+# its patient ID, the same hash for every table. A bucket of conditions and the same
+# bucket of observations (or encounters and medications) therefore hold exactly the
+# same patients. A join can then run bucket by bucket, one bucket per core, and only
+# one bucket of each table needs to be in memory at a time.
+
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from store import COMPRESSION, table_path
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+LAYOUT_DIR = 'by_patient'
+N_BUCKETS = 16
+BATCH_ROWS = 500_000
+
+# Cleaned table -> its patient ID column
+PATIENT_KEYS = {
+    'clean_patients': 'id',
+    'clean_conditions': 'PATIENT',
+    'clean_observations': 'PATIENT',
+    'clean_medications': 'PATIENT',
+    'clean_encounters': 'PATIENT',
+}
+
+def patient_bucket(ids, n_buckets=N_BUCKETS):
+    """Bucket of each patient ID; pandas' hash is seeded with a fixed key, so stable across runs"""
+    return (pd.util.hash_array(np.asarray(ids, dtype=object)) % n_buckets).astype(np.int16)
+
+def layout_path(name, output_dir=OUTPUT_DIR):
+    """Directory holding the buckets of a table, e.g. by_patient/clean_conditions.parquet"""
+    return table_path(f'{LAYOUT_DIR}/{name}', output_dir)
+
+def bucket_path(name, bucket, output_dir=OUTPUT_DIR):
+    return layout_path(name, output_dir) / f'bucket-{bucket:03d}.parquet'
+
+def n_buckets(output_dir=OUTPUT_DIR):
+    """Bucket count of the layout on disk"""
+    return json.loads((Path(output_dir) / LAYOUT_DIR / 'layout.json').read_text())['n_buckets']
+
+def partition_table(name, output_dir=OUTPUT_DIR, n_buckets=N_BUCKETS):
+    """
+    Split a cleaned table into patient-hash buckets, streaming it in record batches so
+    the table never has to fit in memory. Returns the row count of each bucket.
+    """
+    source = pq.ParquetFile(table_path(name, output_dir))
+    directory = layout_path(name, output_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    for stale in directory.glob('bucket-*.parquet'):
+        stale.unlink()
+
+    # One writer per bucket, all opened up front so empty buckets still get a file
+    writers = [pq.ParquetWriter(bucket_path(name, b, output_dir), source.schema_arrow, compression=COMPRESSION)
+               for b in range(n_buckets)]
+    rows = np.zeros(n_buckets, dtype=np.int64)
+    try:
+        for batch in source.iter_batches(batch_size=BATCH_ROWS):
+            buckets = patient_bucket(batch.column(PATIENT_KEYS[name]).to_numpy(zero_copy_only=False), n_buckets)
+            for b in np.unique(buckets):
+                part = batch.filter(buckets == b)
+                writers[b].write_batch(part)
+                rows[b] += part.num_rows
+    finally:
+        for writer in writers:
+            writer.close()
+    return rows
+
+def read_bucket(name, bucket, columns=None, filters=None, output_dir=OUTPUT_DIR):
+    """One bucket of a partitioned table"""
+    return pd.read_parquet(bucket_path(name, bucket, output_dir), columns=columns, filters=filters)
+
+def _run_bucket(func, bucket, tables, output_dir):
+    frames = {name: read_bucket(name, bucket, output_dir=output_dir, **options) for name, options in tables.items()}
+    return func(bucket, frames)
+
+def map_buckets(func, tables, workers=None, output_dir=OUTPUT_DIR):
+    """
+    Call func(bucket, {table: frame}) on each bucket, with `tables` mapping table names to
+    read_bucket options ({'columns': [...], 'filters': [...]}). Buckets run in a process
+    pool, so func must be a top-level function; returns the list of results in bucket order.
+    """
+    buckets = range(n_buckets(output_dir))
+    n = len(buckets)
+    if workers == 1:
+        return [_run_bucket(func, b, tables, output_dir) for b in buckets]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_bucket, [func] * n, buckets, [tables] * n, [output_dir] * n))
+
+def linkage_counts(bucket, frames):
+    """Per-patient row count in each table of one bucket (a full outer join on patient)"""
+    counts = [frame[PATIENT_KEYS[name]].value_counts().rename(name.removeprefix('clean_'))
+              for name, frame in frames.items()]
+    return pd.concat(counts, axis=1).fillna(0).astype(int)
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: partition every cleaned table by patient hash, return the report counts"""
+    counts = {}
+    for name in PATIENT_KEYS:
+        rows = partition_table(name, output_dir)
+        counts[name] = {'rows': int(rows.sum()), 'largest_bucket': int(rows.max())}
+    (Path(output_dir) / LAYOUT_DIR / 'layout.json').write_text(
+        json.dumps({'n_buckets': N_BUCKETS, 'keys': PATIENT_KEYS}, indent=2)
+    )
+    return counts
+
+def report(counts):
+    print(f"### Patient Partition Report ({N_BUCKETS} buckets)")
+    for name, stats in counts.items():
+        print(f"{name}: {stats['rows']:,} rows, largest bucket {stats['largest_bucket']:,}")
+
+if __name__ == "__main__":
+    report(run_stage())
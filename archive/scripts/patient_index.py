@@ -0,0 +1,19 @@
+# patient_index.py
+
+import pandas as pd
+from store import read_file
+
+def build_patient_index(ids):
+    """Hashed index of valid patient IDs; its hash table is built once and reused by every lookup"""
+    if isinstance(ids, pd.Index) and ids.is_unique:
+        return ids
+    return pd.Index(pd.unique(pd.Series(ids).dropna()), name='id')
+
+def load_patient_index(clean_patients_path):
+    """Build the index from the cleaned patients table, reading only its id column"""
+    return build_patient_index(read_file(clean_patients_path, columns=['id'])['id'])
+
+def linked(values, patient_index):
+    """Boolean mask of rows whose PATIENT is in the valid-patient index"""
+    patient_index = build_patient_index(patient_index)
+    return patient_index.get_indexer(values) >= 0
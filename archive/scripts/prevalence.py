@@ -0,0 +1,100 @@
+# prevalence.py
+# Direct age-standardised prevalence with stratified bootstrap confidence intervals.
+#
+# Patients are counted per (group, age band) once; everything after that works on
+# the small count matrices. Resampling patients with replacement within an age band
+# is the same as drawing the band's case count from Binomial(n, cases / n), so a
+# replicate costs one binomial draw per stratum rather than one draw per patient,
+# and blocks of replicates are spread over a process pool.
+
+import numpy as np
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# 5-year age bands, 90+ open-ended
+AGE_EDGES = list(range(0, 95, 5)) + [np.inf]
+AGE_BANDS = [f'{lo}-{lo + 4}' for lo in range(0, 90, 5)] + ['90+']
+
+# Standard populations (weights per age band); pass a Series to use another one
+STANDARD_POPULATIONS = {
+    # 2013 European Standard Population, as used for UK age-standardised rates
+    'esp2013': pd.Series(
+        [5000, 5500, 5500, 5500, 6000, 6000, 6500, 7000, 7000, 7000,
+         7000, 6500, 6000, 5500, 5000, 4000, 2500, 1500, 1000],
+        index=AGE_BANDS,
+    ),
+}
+
+def age_band(age):
+    """Age in years -> 5-year band label (categorical, NaN for missing ages)"""
+    return pd.cut(age, bins=AGE_EDGES, right=False, labels=AGE_BANDS)
+
+def standard_population(standard):
+    weights = STANDARD_POPULATIONS[standard] if isinstance(standard, str) else standard
+    return weights.reindex(AGE_BANDS).fillna(0).astype(float)
+
+def stratum_counts(patients, cases, by=()):
+    """
+    Patients and cases per (group, age band) as two (groups x bands) frames.
+    `patients` needs id and age columns plus any `by` columns; `cases` is the ids with the condition.
+    """
+    by = list(by)
+    df = patients.assign(age_band=age_band(patients['age']), case=patients['id'].isin(cases))
+    df = df.dropna(subset=['age_band'])
+    keys = by if by else [pd.Series('all', index=df.index, name='group')]
+    grouped = df.groupby(keys + ['age_band'], observed=False)['case']
+    n = grouped.size().unstack('age_band').reindex(columns=AGE_BANDS).fillna(0)
+    k = grouped.sum().unstack('age_band').reindex(columns=AGE_BANDS).fillna(0)
+    return n, k
+
+def _band_weights(n, weights):
+    """Per-group standard weights over the bands that group has patients in, summing to 1"""
+    w = np.where(n > 0, weights.to_numpy()[None, :], 0.0)
+    total = w.sum(axis=1, keepdims=True)
+    return np.divide(w, total, out=np.zeros_like(w), where=total > 0)
+
+def _rates(k, n):
+    return np.divide(k, n, out=np.zeros(np.broadcast_shapes(k.shape, n.shape)), where=n > 0)
+
+def _bootstrap_block(n, p, w, replicates, seed):
+    """Standardised rates of `replicates` bootstrap samples, shape (replicates, groups)"""
+    rng = np.random.default_rng(seed)
+    cases = rng.binomial(n.astype(np.int64), p, size=(replicates,) + n.shape)
+    return (_rates(cases, n) * w).sum(axis=-1)
+
+def bootstrap(n, k, weights, n_boot=2000, workers=None, seed=42):
+    """Bootstrap distribution of the standardised rate, shape (n_boot, groups)"""
+    n, k = np.asarray(n, dtype=float), np.asarray(k, dtype=float)
+    p, w = _rates(k, n), _band_weights(n, weights)
+    workers = min(workers or os.cpu_count() or 1, n_boot)
+    blocks = [len(b) for b in np.array_split(np.arange(n_boot), workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    if workers == 1:
+        return _bootstrap_block(n, p, w, n_boot, seeds[0])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(_bootstrap_block, [n] * workers, [p] * workers, [w] * workers, blocks, seeds)
+        return np.concatenate(list(parts))
+
+def age_standardized_prevalence(patients, cases, by=(), standard='esp2013',
+                                n_boot=2000, ci=0.95, workers=None, seed=42):
+    """
+    Crude and directly age-standardised prevalence per group with bootstrap CIs.
+    Bands with no patients in a group are left out of that group's standardisation.
+    """
+    weights = standard_population(standard)
+    n, k = stratum_counts(patients, cases, by)
+    w = _band_weights(n.to_numpy(), weights)
+
+    result = pd.DataFrame(index=n.index)
+    result['patients'] = n.sum(axis=1).astype(int)
+    result['cases'] = k.sum(axis=1).astype(int)
+    result['crude'] = result['cases'] / result['patients']
+    result['standardized'] = (_rates(k.to_numpy(), n.to_numpy()) * w).sum(axis=1)
+
+    if n_boot:
+        replicates = bootstrap(n, k, weights, n_boot, workers, seed)
+        alpha = (1 - ci) / 2
+        result['ci_low'] = np.quantile(replicates, alpha, axis=0)
+        result['ci_high'] = np.quantile(replicates, 1 - alpha, axis=0)
+    return result.reset_index()
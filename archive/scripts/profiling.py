@@ -0,0 +1,217 @@
+# profiling.py
+# One-pass profiling of the cleaned tables with mergeable sketches.
+# Each table is streamed in record batches. Every batch gives a per-column profile:
+# counts, nulls, min/max/sum, a HyperLogLog register array for the distinct count,
+# a log-bucketed histogram (DDSketch) for quantiles and a Misra-Gries summary for
+# the most frequent values. Profiles of batches, partitions or tables merge exactly
+# like the data they describe, so the result does not depend on how the table was
+# split. The report is written as JSON and can be diffed between Synthea drops.
+
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from pathlib import Path
+from store import table_path
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+REPORT_FILE = 'profile.json'
+BATCH_ROWS = 250_000
+
+TABLES = ['clean_patients', 'clean_conditions', 'clean_observations', 'clean_medications', 'clean_encounters']
+
+HLL_PRECISION = 14            # 2**14 registers, about 0.8% standard error
+QUANTILE_ACCURACY = 0.001     # relative error of every reported quantile
+TOP_K_CAPACITY = 64           # counters kept per column; top values are exact below this many distinct values
+TOP_K = 5
+QUANTILES = [0.01, 0.25, 0.5, 0.75, 0.99]
+QUANTILE_LABELS = [f'p{round(q * 100):02d}' for q in QUANTILES]
+
+_GAMMA = (1 + QUANTILE_ACCURACY) / (1 - QUANTILE_ACCURACY)
+
+# --- HyperLogLog ---
+
+def hll_registers(values, precision=HLL_PRECISION):
+    """HyperLogLog registers of the non-null values"""
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    if len(values) == 0:
+        return registers
+    hashes = pd.util.hash_array(np.asarray(values))
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = (hashes & np.uint64((1 << (64 - precision)) - 1)).astype(np.float64)  # exact below 2**53
+    rank = (64 - precision) - np.frexp(rest)[1] + 1  # leading zeros + 1
+    np.maximum.at(registers, index, rank.astype(np.uint8))
+    return registers
+
+def hll_estimate(registers):
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+    return int(round(estimate))
+
+# --- DDSketch (log-bucketed histogram) ---
+
+def dd_buckets(values):
+    """Bucket counts of the positive, negative and zero values"""
+    values = np.asarray(values, dtype=np.float64)
+    def store(x):
+        return pd.Series(np.ceil(np.log(x) / np.log(_GAMMA)).astype(np.int64)).value_counts()
+    return {'pos': store(values[values > 0]), 'neg': store(-values[values < 0]),
+            'zero': int(np.count_nonzero(values == 0))}
+
+def dd_merge(a, b):
+    return {'pos': a['pos'].add(b['pos'], fill_value=0), 'neg': a['neg'].add(b['neg'], fill_value=0),
+            'zero': a['zero'] + b['zero']}
+
+def dd_quantiles(sketch):
+    """Quantiles from the bucket counts, each within QUANTILE_ACCURACY relative error"""
+    neg, pos = sketch['neg'].sort_index(ascending=False), sketch['pos'].sort_index()
+    mid = lambda index, sign: sign * 2 * np.power(_GAMMA, index.to_numpy(np.float64)) / (_GAMMA + 1)
+    values = np.concatenate([mid(neg.index, -1), [0.0], mid(pos.index, 1)])
+    counts = np.concatenate([neg.to_numpy(), [sketch['zero']], pos.to_numpy()]).cumsum()
+    if counts[-1] == 0:
+        return {}
+    ranks = np.searchsorted(counts, np.asarray(QUANTILES) * (counts[-1] - 1), side='right')
+    return {label: float(values[r]) for label, r in zip(QUANTILE_LABELS, ranks)}
+
+# --- Misra-Gries heavy hitters ---
+
+def mg_merge(a, b, capacity=TOP_K_CAPACITY):
+    """Merge two frequency summaries, keeping at most `capacity` counters"""
+    counts = a['counts'].add(b['counts'], fill_value=0)
+    error = a['error'] + b['error']
+    if len(counts) > capacity:
+        cut = counts.nlargest(capacity + 1).iloc[-1]
+        counts, error = counts[counts > cut] - cut, error + cut
+    return {'counts': counts, 'error': error}
+
+# --- Column and table profiles ---
+
+def profile_column(series):
+    """Mergeable profile of one column (or one batch of it)"""
+    values = series.dropna()
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    kind = ('numeric' if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+            else 'datetime' if pd.api.types.is_datetime64_any_dtype(values) else 'text')
+    # Datetimes (tz-aware ones included) are hashed as their int64 nanoseconds
+    raw = pd.DatetimeIndex(values).asi8 if kind == 'datetime' else values.to_numpy()
+    profile = {'kind': kind, 'count': len(series), 'nulls': int(series.isna().sum()),
+               'hll': hll_registers(raw)}
+    if kind == 'numeric':
+        x = values.to_numpy(dtype=np.float64)
+        profile.update(min=x.min(initial=np.inf), max=x.max(initial=-np.inf), sum=x.sum(),
+                       sumsq=np.square(x).sum(), dd=dd_buckets(x))
+    elif kind == 'datetime':
+        profile.update(min=values.min() if len(values) else None, max=values.max() if len(values) else None)
+    else:
+        profile['top'] = mg_merge({'counts': values.astype(str).value_counts(), 'error': 0},
+                                  {'counts': pd.Series(dtype=np.int64), 'error': 0})
+    return profile
+
+def merge_column(a, b):
+    merged = {'kind': a['kind'], 'count': a['count'] + b['count'], 'nulls': a['nulls'] + b['nulls'],
+              'hll': np.maximum(a['hll'], b['hll'])}
+    if a['kind'] == 'numeric':
+        merged.update(min=min(a['min'], b['min']), max=max(a['max'], b['max']), sum=a['sum'] + b['sum'],
+                      sumsq=a['sumsq'] + b['sumsq'], dd=dd_merge(a['dd'], b['dd']))
+    elif a['kind'] == 'datetime':
+        bounds = [v for v in (a['min'], b['min'], a['max'], b['max']) if v is not None]
+        merged.update(min=min(bounds) if bounds else None, max=max(bounds) if bounds else None)
+    else:
+        merged['top'] = mg_merge(a['top'], b['top'])
+    return merged
+
+def profile_frame(df):
+    return {col: profile_column(df[col]) for col in df.columns}
+
+def merge_profiles(a, b):
+    """Combine the profiles of two disjoint parts of a table"""
+    return {col: merge_column(a[col], b[col]) for col in a}
+
+def profile_file(path, batch_rows=BATCH_ROWS):
+    """Profile a Parquet file in one streaming pass over its record batches"""
+    parquet = pq.ParquetFile(path)
+    batches = parquet.iter_batches(batch_size=batch_rows)
+    # Starting from the profile of no rows, a table without any row profiles as empty
+    empty = profile_frame(parquet.schema_arrow.empty_table().to_pandas())
+    return reduce(merge_profiles, (profile_frame(batch.to_pandas()) for batch in batches), empty)
+
+def summarize(profile):
+    """JSON-ready statistics of a merged profile"""
+    summary = {}
+    for col, p in profile.items():
+        present = p['count'] - p['nulls']
+        stats = {'kind': p['kind'], 'count': p['count'], 'nulls': p['nulls'],
+                 'null_rate': round(p['nulls'] / p['count'], 6) if p['count'] else None,
+                 'distinct': hll_estimate(p['hll'])}
+        if p['kind'] == 'numeric' and present:
+            mean = p['sum'] / present
+            stats.update(min=float(p['min']), max=float(p['max']), mean=float(mean),
+                         std=float(np.sqrt(max(p['sumsq'] / present - mean * mean, 0.0))),
+                         quantiles=dd_quantiles(p['dd']))
+        elif p['kind'] == 'datetime' and present:
+            stats.update(min=p['min'].isoformat(), max=p['max'].isoformat())
+        elif p['kind'] == 'text':
+            top = p['top']['counts'].sort_values(ascending=False, kind='stable').head(TOP_K)
+            stats['top'] = [[value, int(count)] for value, count in top.items()]
+            stats['top_error'] = int(p['top']['error'])  # counts may be low by at most this much
+        summary[col] = stats
+    return summary
+
+def profile_table(name, output_dir=OUTPUT_DIR):
+    """Report entry of one cleaned table"""
+    profile = profile_file(table_path(name, output_dir))
+    return {'rows': next(iter(profile.values()))['count'], 'columns': summarize(profile)}
+
+def build_report(output_dir=OUTPUT_DIR, tables=TABLES, workers=None):
+    """Profile the tables, one process each"""
+    tables = [name for name in tables if table_path(name, output_dir).exists()]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(tables, pool.map(profile_table, tables, [output_dir] * len(tables))))
+
+def save_report(report, output_dir=OUTPUT_DIR):
+    path = Path(output_dir) / REPORT_FILE
+    path.write_text(json.dumps(report, indent=2, sort_keys=True, default=str))
+    return path
+
+def load_report(path=OUTPUT_DIR / REPORT_FILE):
+    return json.loads(Path(path).read_text())
+
+def compare_reports(old, new):
+    """Long frame of every scalar statistic that differs between two reports"""
+    def flatten(report):
+        return {(table, col, stat): value
+                for table, entry in report.items()
+                for col, stats in entry['columns'].items()
+                for stat, value in stats.items() if not isinstance(value, (dict, list))}
+    a, b = flatten(old), flatten(new)
+    rows = [(*key, a.get(key), b.get(key)) for key in sorted(a.keys() | b.keys()) if a.get(key) != b.get(key)]
+    return pd.DataFrame(rows, columns=['table', 'column', 'statistic', 'old', 'new'])
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: profile every cleaned table and write the JSON report"""
+    report = build_report(output_dir)
+    save_report(report, output_dir)
+    return {name: entry['rows'] for name, entry in report.items()}
+
+def report(counts):
+    print("### Profile Report")
+    for name, rows in counts.items():
+        print(f"{name}: {rows:,} rows profiled")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the cleaned tables in one streaming pass")
+    parser.add_argument('--compare', type=Path, help="previous profile.json to diff against")
+    args = parser.parse_args()
+
+    previous = load_report(args.compare) if args.compare else None
+    report(run_stage())
+    if previous is not None:
+        print(compare_reports(previous, load_report()).to_string(index=False))
@@ -0,0 +1,65 @@
+# query.py
+# In-process SQL over the cleaned tables.
+# DuckDB views are defined over the Parquet store, so a query reads only the
+# columns and row groups it needs, runs on all cores and returns a small frame.
+# Tables are available under their store name (clean_conditions) and short name
+# (conditions), plus the derived vitals, phenotypes and densities tables.
+#
+#   from query import sql
+#   sql("SELECT CODE, count(*) AS n FROM conditions GROUP BY CODE ORDER BY n DESC LIMIT 5")
+
+import duckdb
+import os
+from pathlib import Path
+from store import table_path
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+
+TABLES = [
+    'clean_patients', 'clean_conditions', 'clean_observations', 'clean_medications',
+    'clean_encounters', 'vitals', 'phenotypes', 'densities', 'exposures',
+]
+
+# One connection per output directory and process, with the tables it has views for
+_CONNECTIONS = {}
+
+def _literal(text):
+    """SQL string literal of a text; quotes in it are doubled"""
+    return "'" + text.replace("'", "''") + "'"
+
+def _views(name):
+    return [name, name.removeprefix('clean_')] if name.startswith('clean_') else [name]
+
+def connect(output_dir=OUTPUT_DIR, threads=None):
+    """
+    DuckDB connection with a view per stored table; tables not built yet are left out.
+    The views are registered again whenever the set of stored tables changed since the
+    last call, so tables written later in the process can be queried too.
+    """
+    key = str(Path(output_dir).resolve())
+    if key not in _CONNECTIONS:
+        con = duckdb.connect()
+        con.execute(f"SET threads = {threads or os.cpu_count() or 1}")
+        _CONNECTIONS[key] = (con, frozenset())
+    con, registered = _CONNECTIONS[key]
+
+    stored = frozenset(name for name in TABLES if table_path(name, output_dir).exists())
+    if stored != registered:
+        for name in TABLES:
+            source = f"read_parquet({_literal(table_path(name, output_dir).resolve().as_posix())})"
+            for view in _views(name):
+                if name in stored:
+                    con.execute(f'CREATE OR REPLACE VIEW "{view}" AS SELECT * FROM {source}')
+                else:
+                    con.execute(f'DROP VIEW IF EXISTS "{view}"')
+        _CONNECTIONS[key] = (con, stored)
+    return con
+
+def sql(query, params=None, output_dir=OUTPUT_DIR):
+    """Run a query against the cleaned tables and return the result as a DataFrame"""
+    return connect(output_dir).execute(query, params or []).df()
+
+def tables(output_dir=OUTPUT_DIR):
+    """Names of the tables available to queries"""
+    return sql("SELECT table_name FROM information_schema.tables ORDER BY table_name", output_dir=output_dir)
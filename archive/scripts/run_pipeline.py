@@ -0,0 +1,296 @@
+# run_pipeline.py
+# Runs the cleaning scripts 01-05 and the tables derived from them (vitals, phenotypes,
+# the density grids, the medication exposure intervals, the profile report, the
+# patient-hash partitions, the timeline store)
+# in dependency order, in one process or,
+# with --workers, fanning the independent stages 02-05 out over a process pool.
+# The valid-patient index is built once and shared with every stage, each raw
+# file is read once, and stages whose inputs and code are unchanged are skipped.
+# With --incremental, the cleaning stages 02-05 only re-clean the row blocks of
+# their raw table that changed since the last run (see incremental.py).
+# Every run writes its per-stage and per-step timings to data/processed/telemetry/
+# (see telemetry.py); --profile runs each stage under one of telemetry.PROFILERS.
+# The ingest_* stages first re-encode each raw export into blocks the loader can read
+# in parallel (see ingest.py). A cleaning stage lists its export's ingest stage under
+# 'after', which orders it behind that stage without making its fingerprint depend on it.
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from graphlib import TopologicalSorter
+from pathlib import Path
+from incremental import file_digest, input_digest, run_incremental
+from patient_index import load_patient_index
+import telemetry
+
+# Configuration
+DATA_DIR = Path('data/original')
+OUTPUT_DIR = Path('data/processed')
+SCRIPT_DIR = Path(__file__).resolve().parent
+STATE_FILE = 'pipeline_state.json'
+
+# Modules every stage imports; a change to them invalidates all stages. Modules only
+# some stages import are listed under the stage's 'code' and invalidate just those
+SHARED_CODE = ['store.py', 'patient_index.py', 'loader.py', 'terminology.py', 'incremental.py', 'temporal.py',
+               'telemetry.py', 'ingest.py']
+
+STAGES = {
+    # One ingest stage per export, so each is fingerprinted and skipped on its own
+    **{f'ingest_{file.split(".")[0]}': {
+        'script': 'ingest',
+        'inputs': [file],
+        'outputs': [f'blocked/{file}.index.json'],
+        'depends': [],
+        'options': {'files': [file]},
+    } for file in ['patients.csv.gz', 'conditions.csv.gz', 'observations.csv.gz', 'medications.csv.gz',
+                   'encounters.csv.gz']},
+    'patients': {
+        'script': '01_patient_cleaning',
+        'inputs': ['patients.csv.gz'],
+        'outputs': ['clean_patients', 'excluded_patients'],
+        'depends': [],
+        'after': ['ingest_patients'],
+    },
+    'conditions': {
+        'script': '02_conditions_cleaning',
+        'inputs': ['conditions.csv.gz', 'dictionary_snomed.csv'],
+        'outputs': ['clean_conditions'],
+        'depends': ['patients'],
+        'after': ['ingest_conditions'],
+        'patient_index': True,
+    },
+    'observations': {
+        'script': '03_observations_cleaning',
+        'inputs': ['observations.csv.gz', 'dictionary_loinc.csv'],
+        'outputs': ['clean_observations', 'quarantined_observations'],
+        'code': ['validation.py'],
+        'depends': ['patients'],
+        'after': ['ingest_observations'],
+        'patient_index': True,
+    },
+    'medications': {
+        'script': '04_medications_cleaning',
+        'inputs': ['medications.csv.gz', 'dictionary_rxnorm.csv'],
+        'outputs': ['clean_medications'],
+        'depends': ['patients'],
+        'after': ['ingest_medications'],
+        'patient_index': True,
+    },
+    'encounters': {
+        'script': '05_encounters_cleaning',
+        'inputs': ['encounters.csv.gz'],
+        'outputs': ['clean_encounters'],
+        'depends': ['patients'],
+        'after': ['ingest_encounters'],
+        'patient_index': True,
+    },
+    'vitals': {
+        'script': 'vitals',
+        'inputs': [],
+        'outputs': ['vitals'],
+        'depends': ['observations'],
+    },
+    'phenotypes': {
+        'script': 'cohorts',
+        'inputs': [],
+        'outputs': ['phenotypes'],
+        'depends': ['conditions'],
+    },
+    'densities': {
+        'script': 'density',
+        'inputs': [],
+        'outputs': ['densities'],
+        'code': ['vitals.py', 'cohorts.py'],
+        'depends': ['vitals', 'phenotypes'],
+    },
+    'exposures': {
+        'script': 'exposure',
+        'inputs': [],
+        'outputs': ['exposures'],
+        'depends': ['medications'],
+    },
+    'timeline': {
+        'script': 'timeline',
+        'inputs': [],
+        'outputs': ['timeline/meta.json'],
+        'code': ['partitions.py'],
+        'depends': ['partitions'],
+    },
+    'profile': {
+        'script': 'profiling',
+        'inputs': [],
+        'outputs': ['profile.json'],
+        'depends': ['patients', 'conditions', 'observations', 'medications', 'encounters'],
+    },
+    'partitions': {
+        'script': 'partitions',
+        'inputs': [],
+        'outputs': ['by_patient/clean_patients', 'by_patient/clean_conditions', 'by_patient/clean_observations',
+                    'by_patient/clean_medications', 'by_patient/clean_encounters'],
+        'depends': ['patients', 'conditions', 'observations', 'medications', 'encounters'],
+    },
+}
+
+def input_digests(name, data_dir=DATA_DIR, output_dir=OUTPUT_DIR):
+    """Content hash of each input file of a stage"""
+    return {i: input_digest(data_dir / i, output_dir) for i in STAGES[name]['inputs']}
+
+def stage_context(name, digests):
+    """
+    Hash of what a stage's cleaned rows depend on besides the rows themselves: its code
+    (script, its 'code' modules and SHARED_CODE) and its dictionaries (every input after
+    the raw table). A dictionary or rule change therefore invalidates only the stages
+    that list it, and those downstream of them.
+    """
+    stage = STAGES[name]
+    digest = hashlib.sha256()
+    for code in [stage['script'] + '.py'] + stage.get('code', []) + SHARED_CODE:
+        digest.update(file_digest(SCRIPT_DIR / code).encode())
+    for input_name in stage['inputs'][1:]:
+        digest.update(f"{input_name}:{digests[input_name]}".encode())
+    return digest.hexdigest()
+
+def stage_fingerprint(name, fingerprints, digests):
+    """Hash of the stage context, its raw table's content and its upstream fingerprints"""
+    stage = STAGES[name]
+    digest = hashlib.sha256(stage_context(name, digests).encode())
+    for input_name in stage['inputs'][:1]:
+        digest.update(f"{input_name}:{digests[input_name]}".encode())
+    for upstream in stage['depends']:
+        digest.update(fingerprints[upstream].encode())
+    return digest.hexdigest()
+
+def load_state(output_dir=OUTPUT_DIR):
+    path = output_dir / STATE_FILE
+    return json.loads(path.read_text()) if path.exists() else {}
+
+def save_state(state, output_dir=OUTPUT_DIR):
+    (output_dir / STATE_FILE).write_text(json.dumps(state, indent=2))
+
+def output_path(output, output_dir=OUTPUT_DIR):
+    """Stage outputs are store table names unless they carry their own suffix"""
+    return output_dir / (output if Path(output).suffix else f'{output}.parquet')
+
+def is_fresh(name, fingerprint, state, output_dir=OUTPUT_DIR):
+    outputs_exist = all(output_path(table, output_dir).exists() for table in STAGES[name]['outputs'])
+    return outputs_exist and state.get(name, {}).get('fingerprint') == fingerprint
+
+def execute_stage(name, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR, incremental=None):
+    """
+    Run one stage; top-level so it can be shipped to a worker process. `incremental` is
+    (context, input digests) to clean only changed blocks, for stages with a clean_block.
+    """
+    stage = STAGES[name]
+    module = importlib.import_module(stage['script'])
+    if valid_patients is None:
+        return module.run_stage(data_dir, output_dir, **stage.get('options', {}))
+    if incremental is not None and hasattr(module, 'clean_block'):
+        context, digests = incremental
+        return run_incremental(name, module, valid_patients, stage['outputs'], context, digests,
+                               data_dir, output_dir)
+    return module.run_stage(valid_patients, data_dir, output_dir)
+
+def execute_recorded(name, valid_patients, data_dir=DATA_DIR, output_dir=OUTPUT_DIR, incremental=None,
+                     profiler=None, profile_dir=None):
+    """execute_stage under telemetry; returns the counts and the stage's telemetry records"""
+    with telemetry.stage(name, profiler, profile_dir):
+        counts = execute_stage(name, valid_patients, data_dir, output_dir, incremental)
+    return counts, telemetry.collect()
+
+def run_pipeline(data_dir=DATA_DIR, output_dir=OUTPUT_DIR, force=False, workers=1, incremental=False,
+                 profiler=None):
+    """
+    Run every stage in dependency order; returns {stage: status} where status is ran/skipped/missing.
+    With workers > 1, stages whose dependencies are done run concurrently in a process pool,
+    so 02-05 take about as long as the slowest of them. With incremental, cleaning stages
+    whose inputs changed re-clean only the changed blocks of their raw table. Telemetry
+    of the stages that ran is saved as one JSON document per run.
+    """
+    output_dir.mkdir(exist_ok=True)
+    state = load_state(output_dir)
+    run = telemetry.new_run(force=force, workers=workers, incremental=incremental, profiler=profiler)
+    started = time.perf_counter()
+    profile_dir = telemetry.profile_dir(run, output_dir) if profiler else None
+    fingerprints, status = {}, {}
+    valid_patients = None
+
+    sorter = TopologicalSorter({name: s['depends'] + s.get('after', []) for name, s in STAGES.items()})
+    sorter.prepare()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = {}
+
+    def finish(name, result):
+        counts, records = result
+        run['stages'].extend(records)
+        module = importlib.import_module(STAGES[name]['script'])
+        module.report(counts)
+        state[name] = {'fingerprint': fingerprints[name], 'counts': counts}
+        save_state(state, output_dir)
+        status[name] = 'ran'
+        sorter.done(name)
+
+    try:
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                stage = STAGES[name]
+                missing = [i for i in stage['inputs'] if not (data_dir / i).exists()]
+                if missing or any(status[d] == 'missing' for d in stage['depends']):
+                    print(f"[{name}] missing inputs {missing}, skipped")
+                    status[name] = 'missing'
+                    sorter.done(name)
+                    continue
+
+                digests = input_digests(name, data_dir, output_dir)
+                fingerprints[name] = stage_fingerprint(name, fingerprints, digests)
+                if not force and is_fresh(name, fingerprints[name], state, output_dir):
+                    print(f"[{name}] unchanged, skipped")
+                    status[name] = 'skipped'
+                    sorter.done(name)
+                    continue
+
+                # Built once, on first use, and shared by every stage that filters on it
+                shared = None
+                if stage.get('patient_index'):
+                    if valid_patients is None:
+                        valid_patients = load_patient_index(output_dir / 'clean_patients.parquet')
+                    shared = valid_patients
+
+                blocks = (stage_context(name, digests), digests) if incremental and not force else None
+                print(f"[{name}] running {stage['script']}")
+                if pool is None:
+                    finish(name, execute_recorded(name, shared, data_dir, output_dir, blocks, profiler, profile_dir))
+                else:
+                    pending[pool.submit(execute_recorded, name, shared, data_dir, output_dir, blocks,
+                                        profiler, profile_dir)] = name
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(pending.pop(future), future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        print(f"Telemetry written to {telemetry.save_run(run, status, output_dir, started)}")
+
+    return status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Synthea cleaning pipeline (scripts 01-05)")
+    parser.add_argument('--force', action='store_true', help="re-run every stage even if unchanged")
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f"stages to run in parallel (this machine has {os.cpu_count()} cores)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="re-clean only the changed row blocks of each raw table")
+    parser.add_argument('--profile', choices=sorted(telemetry.PROFILERS),
+                        help="run each stage under this profiler; output goes to data/processed/telemetry/")
+    args = parser.parse_args()
+
+    status = run_pipeline(force=args.force, workers=args.workers, incremental=args.incremental,
+                          profiler=args.profile)
+    print("\n=== Pipeline Summary ===")
+    for name, result in status.items():
+        print(f"{name}: {result}")
@@ -0,0 +1,100 @@
+# store.py
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from contextlib import contextmanager
+from pathlib import Path
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+COMPRESSION = 'zstd'
+
+# Low-cardinality text columns stored as dictionary-encoded categoricals
+CATEGORICAL_COLUMNS = [
+    'race', 'ethnicity', 'gender', 'marital', 'data_quality_flag',
+    'ENCOUNTERCLASS', 'CATEGORY', 'UNITS', 'TYPE',
+]
+
+def table_path(name, output_dir=OUTPUT_DIR):
+    return Path(output_dir) / f'{name}.parquet'
+
+def _to_arrow(df, schema=None):
+    """Convert a frame to an Arrow table, categorising the low-cardinality columns"""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is not None:
+        table = table.cast(schema)
+    return table
+
+def _chunk_schema(table):
+    """Widen dictionary indices so chunks with different category sets share one schema"""
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        elif pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+def write_table(df, name, output_dir=OUTPUT_DIR):
+    """Write a cleaned table to the Parquet store, keeping dtypes"""
+    path = table_path(name, output_dir)
+    pq.write_table(_to_arrow(df), path, compression=COMPRESSION)
+    return path
+
+@contextmanager
+def chunk_writer(name, output_dir=OUTPUT_DIR):
+    """
+    Yield a function that appends a frame to one Parquet file, for a table filled chunk by
+    chunk alongside another; the file exists once the first frame is appended.
+    """
+    path = table_path(name, output_dir)
+    writer, schema = None, None
+
+    def append(chunk):
+        nonlocal writer, schema
+        if writer is None:
+            schema = _chunk_schema(_to_arrow(chunk))
+            writer = pq.ParquetWriter(path, schema, compression=COMPRESSION)
+        writer.write_table(_to_arrow(chunk, schema))
+
+    try:
+        yield append
+    finally:
+        if writer is not None:
+            writer.close()
+
+def write_chunks(chunks, name, output_dir=OUTPUT_DIR):
+    """Write an iterable of frames as one Parquet file without holding them all in memory"""
+    with chunk_writer(name, output_dir) as append:
+        for chunk in chunks:
+            append(chunk)
+    return table_path(name, output_dir)
+
+def read_file(path, columns=None):
+    """Read a cleaned table from Parquet or CSV, loading only the requested columns"""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+def read_table(name, columns=None, output_dir=OUTPUT_DIR):
+    """Read a cleaned table by name, falling back to the CSV hand-off of older runs"""
+    path = table_path(name, output_dir)
+    if not path.exists():
+        path = Path(output_dir) / f'{name}.csv'
+    return read_file(path, columns)
+
+def numeric_columns(name, output_dir=OUTPUT_DIR):
+    """Numeric columns of a stored table, read from the Parquet footer only"""
+    path = table_path(name, output_dir)
+    if not path.exists():
+        sample = pd.read_csv(Path(output_dir) / f'{name}.csv', nrows=1000)
+        return sample.select_dtypes('number').columns.tolist()
+    schema = pq.read_schema(path)
+    return [f.name for f in schema if pa.types.is_integer(f.type) or pa.types.is_floating(f.type)]
@@ -0,0 +1,209 @@
+# synthetic.py
+# Synthea-shaped synthetic data at any number of patients, for benchmarking.
+# Patients, encounters, conditions and medications are resampled row-wise from the
+# bundled sample in data/original, so column formats, value mixes and data quality
+# problems (invalid demographics, orphan patient IDs, float-formatted codes) match the
+# real export. New IDs and dates tie the rows together, and rows per patient follow
+# the sample's rates. Codes follow the sample frequencies, and a share of them are
+# drawn uniformly from the bundled dictionaries. Observations (not in the bundled
+# sample) are generated from per-code templates for the vitals the analyses use, plus
+# other dictionary LOINC codes. Patients are generated in chunks, so memory stays
+# flat at any scale.
+
+import argparse
+import gzip
+import numpy as np
+import pandas as pd
+import shutil
+from pathlib import Path
+from loader import SCHEMAS, load_table, table_path
+from temporal import REFERENCE_DATE, parse_timestamps
+
+# Configuration
+SAMPLE_DIR = Path('data/original')
+CHUNK_PATIENTS = 10_000
+DICTIONARY_SHARE = 0.05   # share of codes drawn uniformly from the dictionary instead of the sample
+COMPRESSLEVEL = 1         # fast gzip; the generator is not what is being measured
+
+# Tables resampled from the sample -> the dictionary their CODE is drawn from (None: sample only)
+RESAMPLED = {
+    'encounters': None,
+    'conditions': 'dictionary_snomed',
+    'medications': 'dictionary_rxnorm',
+}
+
+# LOINC code -> (category, units, type, value distribution) recorded at every encounter
+VITAL_TEMPLATES = {
+    '8480-6': ('vital-signs', 'mm[Hg]', 'numeric', (125.0, 18.0)),
+    '8462-4': ('vital-signs', 'mm[Hg]', 'numeric', (80.0, 12.0)),
+    '39156-5': ('vital-signs', 'kg/m2', 'numeric', (28.0, 6.0)),
+    '72166-2': ('survey', None, 'text', ['Never smoker', 'Former smoker', 'Current every day smoker']),
+}
+OTHER_OBSERVATIONS_PER_ENCOUNTER = 0.5
+UNPARSEABLE_VALUE_SHARE = 0.001   # 'abc'-style values the cleaner has to coerce
+
+DICTIONARIES = ['dictionary_snomed', 'dictionary_loinc', 'dictionary_rxnorm']
+
+NAT = np.iinfo(np.int64).min
+
+def load_sample(sample_dir=SAMPLE_DIR):
+    """Raw sample tables as strings (formats untouched), dictionaries and per-patient rates"""
+    read = lambda name: pd.read_csv(table_path(name, sample_dir), dtype=str)
+    sample = {'patients': read('patients')}
+    patients = set(sample['patients']['Id'])
+    sample['rates'], sample['orphans'] = {}, {}
+    for name in RESAMPLED:
+        sample[name] = read(name)
+        sample['rates'][name] = len(sample[name]) / len(sample['patients'])
+        sample['orphans'][name] = float((~sample[name]['PATIENT'].isin(patients)).mean())
+    for name in DICTIONARIES:
+        sample[name] = load_table(name, data_dir=sample_dir)
+    return sample
+
+def _uuids(rng, n):
+    halves = rng.integers(0, 2**63, size=(n, 2), dtype=np.int64)
+    hexes = [f'{a:016x}{b:016x}' for a, b in halves]
+    return np.array([f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}' for h in hexes], dtype=object)
+
+def _bootstrap(rng, frame, n):
+    return frame.iloc[rng.integers(0, len(frame), n)].reset_index(drop=True)
+
+def _counts(rng, n, mean):
+    """Overdispersed rows-per-patient counts with the given mean"""
+    return rng.poisson(rng.exponential(mean, n))
+
+def _iso(ns, unit):
+    """int64 nanoseconds -> Synthea date ('D') or UTC timestamp ('s') strings; NaT -> NaN"""
+    values = np.asarray(ns, dtype='datetime64[ns]')
+    text = np.datetime_as_string(values, unit=unit).astype(object)
+    if unit == 's':
+        text = text + 'Z'
+    text[np.isnat(values)] = np.nan
+    return text
+
+def _ns(values, kind):
+    return parse_timestamps(pd.Series(values), kind).dt.tz_localize(None).to_numpy('datetime64[ns]').astype(np.int64)
+
+def _shifted(start, stop, begin):
+    """Move each (start, stop) interval to begin at `begin`; a missing stop stays missing"""
+    valid = (start != NAT) & (stop != NAT)
+    return np.where(valid, begin + np.where(valid, stop - start, 0), NAT)
+
+def _orphaned(rng, ids, share):
+    """Replace a share of patient references with IDs that are not in patients"""
+    ids = ids.copy()
+    orphan = rng.random(len(ids)) < share
+    ids[orphan] = _uuids(rng, int(orphan.sum()))
+    return ids
+
+def _mix_codes(rng, codes, dictionary):
+    codes = codes.to_numpy(dtype=object).copy()
+    if dictionary is not None:
+        replace = rng.random(len(codes)) < DICTIONARY_SHARE
+        codes[replace] = rng.choice(dictionary['CODE'].to_numpy(dtype=object), int(replace.sum()))
+    return codes
+
+def _observations(rng, encounters, sample):
+    """Vitals at every encounter plus a few other dictionary LOINC codes"""
+    loinc = sample['dictionary_loinc'].drop_duplicates('CODE').set_index('CODE')['DESCRIPTION']
+    frames = []
+    for code, (category, units, kind, dist) in VITAL_TEMPLATES.items():
+        n = len(encounters)
+        if kind == 'numeric':
+            values = np.round(rng.normal(*dist, n), 1).astype(object)
+        else:
+            values = rng.choice(np.array(dist, dtype=object), n)
+        frames.append(pd.DataFrame({'row': np.arange(n), 'CATEGORY': category, 'CODE': code,
+                                    'DESCRIPTION': loinc.get(code), 'VALUE': values, 'UNITS': units, 'TYPE': kind}))
+    extra = rng.poisson(OTHER_OBSERVATIONS_PER_ENCOUNTER, len(encounters))
+    rows = np.repeat(np.arange(len(encounters)), extra)
+    codes = rng.choice(loinc.index.to_numpy(dtype=object), len(rows))
+    frames.append(pd.DataFrame({'row': rows, 'CATEGORY': 'laboratory', 'CODE': codes,
+                                'DESCRIPTION': loinc.reindex(codes).to_numpy(),
+                                'VALUE': np.round(rng.lognormal(3, 1, len(rows)), 2).astype(object),
+                                'UNITS': None, 'TYPE': 'numeric'}))
+    obs = pd.concat(frames, ignore_index=True).sort_values('row', kind='stable')
+    dirty = rng.random(len(obs)) < UNPARSEABLE_VALUE_SHARE
+    obs.loc[dirty, 'VALUE'] = 'abc'
+    source = encounters.iloc[obs['row'].to_numpy()]
+    obs.insert(0, 'ENCOUNTER', source['Id'].to_numpy())
+    obs.insert(0, 'PATIENT', source['PATIENT'].to_numpy())
+    obs.insert(0, 'DATE', source['START'].to_numpy())
+    return obs[list(SCHEMAS['observations']['dtypes'])]
+
+def generate_chunk(rng, sample, n_patients):
+    """One chunk of all five tables for n_patients new patients"""
+    patients = _bootstrap(rng, sample['patients'], n_patients)
+    patients['Id'] = _uuids(rng, n_patients)
+    birth = _ns(patients['BIRTHDATE'], 'date')
+    death = _ns(patients['DEATHDATE'], 'date')
+    reference = REFERENCE_DATE.tz_localize(None).value
+    end = np.where((death == NAT) | (death > reference), reference, death)
+    birth = np.where(birth == NAT, end - 40 * 365 * 86_400 * 10**9, birth)
+
+    # Encounters at random times of each patient's life
+    n_enc = _counts(rng, n_patients, sample['rates']['encounters'])
+    owner = np.repeat(np.arange(n_patients), n_enc)
+    encounters = _bootstrap(rng, sample['encounters'], len(owner))
+    start = birth[owner] + (rng.random(len(owner)) * np.maximum(end - birth, 0)[owner]).astype(np.int64)
+    stop = _shifted(_ns(encounters['START'], 'datetime'), _ns(encounters['STOP'], 'datetime'), start)
+    encounters['Id'] = _uuids(rng, len(owner))
+    encounters['START'] = _iso(start, 's')
+    encounters['STOP'] = _iso(stop, 's')
+    encounters['PATIENT'] = _orphaned(rng, patients['Id'].to_numpy()[owner], sample['orphans']['encounters'])
+    tables = {'patients': patients, 'encounters': encounters}
+
+    # Conditions and medications recorded at one of the patient's encounters
+    first = np.concatenate([[0], np.cumsum(n_enc)[:-1]])
+    for name in ['conditions', 'medications']:
+        n_rows = np.where(n_enc > 0, _counts(rng, n_patients, sample['rates'][name]), 0)
+        patient = np.repeat(np.arange(n_patients), n_rows)
+        encounter = first[patient] + (rng.random(len(patient)) * n_enc[patient]).astype(np.int64)
+        rows = _bootstrap(rng, sample[name], len(patient))
+        kind, unit = ('date', 'D') if name == 'conditions' else ('datetime', 's')
+        begin = start[encounter]
+        stop = _shifted(_ns(rows['START'], kind), _ns(rows['STOP'], kind), begin)
+        rows['START'] = _iso(begin, unit)
+        rows['STOP'] = _iso(stop, unit)
+        rows['PATIENT'] = _orphaned(rng, patients['Id'].to_numpy()[patient], sample['orphans'][name])
+        rows['ENCOUNTER'] = encounters['Id'].to_numpy()[encounter]
+        rows['CODE'] = _mix_codes(rng, rows['CODE'], sample[RESAMPLED[name]])
+        tables[name] = rows
+
+    tables['observations'] = _observations(rng, encounters, sample)
+    return tables
+
+def generate(n_patients, data_dir, sample_dir=SAMPLE_DIR, seed=0, chunk_patients=CHUNK_PATIENTS):
+    """
+    Write a Synthea-shaped export of n_patients to data_dir (gzipped CSVs plus the bundled
+    dictionaries). Returns the rows written per table.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    sample = load_sample(sample_dir)
+    rng = np.random.default_rng(seed)
+    for name in DICTIONARIES:
+        shutil.copy(table_path(name, sample_dir), table_path(name, data_dir))
+
+    rows = dict.fromkeys(['patients', *RESAMPLED, 'observations'], 0)
+    files = {name: gzip.open(table_path(name, data_dir), 'wt', compresslevel=COMPRESSLEVEL) for name in rows}
+    try:
+        for offset in range(0, n_patients, chunk_patients):
+            chunk = generate_chunk(rng, sample, min(chunk_patients, n_patients - offset))
+            for name, frame in chunk.items():
+                frame.to_csv(files[name], index=False, header=offset == 0)
+                rows[name] += len(frame)
+    finally:
+        for f in files.values():
+            f.close()
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a Synthea-shaped export for benchmarking")
+    parser.add_argument('patients', type=int, help="number of patients, e.g. 10000")
+    parser.add_argument('--output', type=Path, default=Path('data/synthetic/original'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, n in generate(args.patients, args.output, seed=args.seed).items():
+        print(f"{name}: {n:,} rows")
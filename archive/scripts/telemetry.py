@@ -0,0 +1,256 @@
+# telemetry.py
+# Structured run telemetry for the pipeline.
+# Stages run inside `stage(name)`, and the cleaners wrap their steps (load, patient
+# filter, code validation, type coercion, write) in `step(name)`. A step records wall
+# time (inclusive and exclusive of nested steps), rows in/out, bytes read or written
+# and the change in resident memory. Steps repeated per chunk or block are summed.
+# run_pipeline.py writes one JSON document per run to data/processed/telemetry/, and
+# `python telemetry.py` shows how the steps trend across runs.
+# A stage can also run under a profiler from PROFILERS (cProfile, tracemalloc or a
+# stack-sampling profiler); its output goes next to the run's JSON.
+
+import argparse
+import cProfile
+import json
+import os
+import pandas as pd
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from loader import LOAD_STATS
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+TELEMETRY_DIR = 'telemetry'
+SAMPLE_INTERVAL = 0.005   # seconds between stacks of the sampling profiler
+TRACEMALLOC_TOP = 25      # allocation sites kept by the tracemalloc profiler
+
+# Finished stage records of this process, until collected
+RECORDS = []
+
+# Open stage record and the stack of open steps
+_STAGE = None
+_OPEN_STEPS = []
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+def rss_mb():
+    """Current resident set size; falls back to the peak where /proc is not available (None without either)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where the resource module is unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes on macOS, KiB on Linux
+
+# --- Profilers: name -> context manager factory(path without suffix) ---
+
+@contextmanager
+def _cprofile(path):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path.with_suffix('.prof'))  # python -m pstats <file>
+
+@contextmanager
+def _tracemalloc(path):
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        top = tracemalloc.take_snapshot().statistics('lineno')[:TRACEMALLOC_TOP]
+        tracemalloc.stop()
+        path.with_suffix('.tracemalloc.txt').write_text('\n'.join(str(s) for s in top) + '\n')
+
+@contextmanager
+def _sampling(path, interval=SAMPLE_INTERVAL):
+    """Sample the calling thread's stack; writes folded stacks for flame graph tools"""
+    target, stacks, stop = threading.get_ident(), Counter(), threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[';'.join(reversed(stack))] += 1
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        path.with_suffix('.folded').write_text(''.join(f"{s} {n}\n" for s, n in stacks.most_common()))
+
+PROFILERS = {
+    'cprofile': _cprofile,
+    'tracemalloc': _tracemalloc,
+    'sampling': _sampling,
+}
+
+# --- Stages and steps ---
+
+@contextmanager
+def stage(name, profiler=None, profile_dir=None):
+    """Record a stage and the steps run inside it, optionally under a profiler"""
+    global _STAGE
+    record = {'stage': name, 'pid': os.getpid(), 'started': _now(), 'profiler': profiler, 'steps': {}}
+    loads = len(LOAD_STATS)
+    start = time.perf_counter()
+    _STAGE = record
+    try:
+        if profiler is None:
+            yield record
+        else:
+            Path(profile_dir).mkdir(parents=True, exist_ok=True)
+            with PROFILERS[profiler](Path(profile_dir) / name):
+                yield record
+    finally:
+        _STAGE = None
+        record['seconds'] = time.perf_counter() - start
+        record['peak_rss_mb'] = peak_rss_mb()
+        record['loads'] = LOAD_STATS[loads:]
+        record['steps'] = list(record['steps'].values())
+        RECORDS.append(record)
+
+@contextmanager
+def step(name, rows_in=None):
+    """
+    Time one step of the current stage. Set 'rows_out' (and 'bytes' for writes) on the
+    yielded dict; bytes default to what the loader read during the step. Outside a
+    stage the step is not recorded.
+    """
+    record = {'rows_in': rows_in, 'rows_out': None, 'bytes': None, 'child_seconds': 0.0}
+    loads = len(LOAD_STATS)
+    rss, start = rss_mb(), time.perf_counter()
+    _OPEN_STEPS.append(record)
+    try:
+        yield record
+    finally:
+        _OPEN_STEPS.pop()
+        seconds = time.perf_counter() - start
+        if _OPEN_STEPS:
+            _OPEN_STEPS[-1]['child_seconds'] += seconds
+        if record['bytes'] is None and len(LOAD_STATS) > loads:
+            record['bytes'] = sum(load['bytes_read'] for load in LOAD_STATS[loads:])
+        if _STAGE is not None:
+            _add_step(name, record, seconds, None if rss is None else rss_mb() - rss)
+
+def _add_step(name, record, seconds, rss_delta):
+    total = _STAGE['steps'].setdefault(name, {
+        'step': name, 'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0,
+        'rows_in': None, 'rows_out': None, 'bytes': None, 'rss_delta_mb': None,
+    })
+    total['calls'] += 1
+    total['seconds'] += seconds
+    total['self_seconds'] += seconds - record['child_seconds']
+    for key in ['rows_in', 'rows_out', 'bytes']:
+        if record[key] is not None:
+            total[key] = (total[key] or 0) + int(record[key])
+    if rss_delta is not None:
+        total['rss_delta_mb'] = max(total['rss_delta_mb'] or rss_delta, rss_delta)  # largest single call
+
+def iter_step(name, chunks):
+    """Yield from an iterator of frames, timing each fetch as one call of the step"""
+    chunks = iter(chunks)
+    while True:
+        with step(name) as s:
+            chunk = next(chunks, None)
+            s['rows_out'] = len(chunk) if chunk is not None else None
+        if chunk is None:
+            return
+        yield chunk
+
+def collect():
+    """Finished stage records of this process, removed so a worker can ship them back"""
+    records = RECORDS[:]
+    RECORDS.clear()
+    return records
+
+# --- Runs ---
+
+def telemetry_dir(output_dir=OUTPUT_DIR):
+    return Path(output_dir) / TELEMETRY_DIR
+
+def new_run(**options):
+    """Header of a run document; pass the pipeline options to keep them with the timings"""
+    started = datetime.now(timezone.utc)
+    return {
+        'run_id': f"{started:%Y%m%dT%H%M%SZ}-{os.getpid()}",
+        'started': started.isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'argv': sys.argv,
+        'options': options,
+        'stages': [],
+    }
+
+def profile_dir(run, output_dir=OUTPUT_DIR):
+    return telemetry_dir(output_dir) / run['run_id']
+
+def save_run(run, status, output_dir=OUTPUT_DIR, started=None):
+    """Finish a run document and write it as telemetry/<run_id>.json"""
+    run.update(finished=_now(), status=status)
+    if started is not None:
+        run['seconds'] = time.perf_counter() - started
+    path = telemetry_dir(output_dir) / f"{run['run_id']}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(run, indent=2, default=str))
+    return path
+
+def load_runs(output_dir=OUTPUT_DIR):
+    """Every recorded step of every run as a long frame, oldest run first"""
+    rows = []
+    for path in sorted(telemetry_dir(output_dir).glob('*.json')):
+        run = json.loads(path.read_text())
+        for record in run['stages']:
+            base = {'run_id': run['run_id'], 'started': run['started'], 'stage': record['stage']}
+            rows.append({**base, 'step': '(stage)', 'seconds': record['seconds'],
+                         'peak_rss_mb': record['peak_rss_mb']})
+            rows.extend({**base, **s} for s in record['steps'])
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trend the recorded pipeline runs")
+    parser.add_argument('--runs', type=int, default=5, help="number of most recent runs to show")
+    parser.add_argument('--metric', default='self_seconds',
+                        choices=['seconds', 'self_seconds', 'rows_out', 'bytes', 'rss_delta_mb'])
+    args = parser.parse_args()
+
+    steps = load_runs()
+    if steps.empty:
+        print(f"No runs recorded in {telemetry_dir()}")
+    else:
+        recent = steps[steps['run_id'].isin(steps['run_id'].drop_duplicates().tail(args.runs))]
+        recent = recent.assign(value=recent[args.metric].fillna(recent['seconds']) if args.metric == 'self_seconds'
+                               else recent[args.metric])
+        print(f"\n=== {args.metric} per step, last {args.runs} runs ===")
+        print(recent.pivot_table(index=['stage', 'step'], columns='run_id', values='value', sort=False)
+              .to_string(float_format=lambda x: f"{x:,.2f}"))
@@ -0,0 +1,72 @@
+# terminology.py
+# Terminology index for SNOMED-CT, LOINC and RxNorm.
+# Each dictionary is loaded once per process, its codes normalized to strings,
+# and cached under data/processed/cache as a code -> description lookup that is
+# rebuilt only when the source dictionary is newer than the cache. Both caches are
+# keyed by the dictionary's resolved path, so runs over another data directory
+# never see the lookups of the default one.
+
+import hashlib
+import pandas as pd
+from pathlib import Path
+from loader import DATA_DIR, load_table, table_path
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+CACHE_DIR = OUTPUT_DIR / 'cache'  # index_cache_dir(OUTPUT_DIR)
+
+SYSTEMS = {
+    'snomed': 'dictionary_snomed',
+    'loinc': 'dictionary_loinc',
+    'rxnorm': 'dictionary_rxnorm',
+}
+
+# In-process cache: resolved dictionary path -> Series of descriptions indexed by code
+_INDEXES = {}
+
+def index_cache_dir(output_dir=OUTPUT_DIR):
+    """Where the terminology lookups of a given output directory are cached"""
+    return Path(output_dir) / 'cache'
+
+def source_path(system, data_dir=DATA_DIR):
+    return table_path(SYSTEMS[system], data_dir).resolve()
+
+def cache_path(system, cache_dir=CACHE_DIR, data_dir=DATA_DIR):
+    key = hashlib.sha256(str(source_path(system, data_dir)).encode()).hexdigest()[:16]
+    return Path(cache_dir) / f'terminology_{system}_{key}.parquet'
+
+def build_index(system, data_dir=DATA_DIR):
+    """Code -> description Series with a unique string index, straight from the dictionary"""
+    dictionary = load_table(SYSTEMS[system], data_dir=data_dir)
+    dictionary = dictionary.dropna(subset=['CODE']).drop_duplicates('CODE')
+    return pd.Series(dictionary['DESCRIPTION'].to_numpy(), index=pd.Index(dictionary['CODE'], name='CODE'),
+                     name='DESCRIPTION')
+
+def load_index(system, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Terminology index for a system, from memory, the disk cache or the source dictionary"""
+    source = source_path(system, data_dir)
+    if source in _INDEXES:
+        return _INDEXES[source]
+
+    cached = cache_path(system, cache_dir, data_dir)
+    if cached.exists() and cached.stat().st_mtime_ns >= source.stat().st_mtime_ns:
+        index = pd.read_parquet(cached)['DESCRIPTION']
+    else:
+        index = build_index(system, data_dir)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        index.to_frame().to_parquet(cached)
+
+    _INDEXES[source] = index
+    return index
+
+def codes(system, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Index of the valid codes of a system"""
+    return load_index(system, data_dir, cache_dir).index
+
+def is_valid(system, values, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Vectorized membership check of codes against the system's dictionary"""
+    return codes(system, data_dir, cache_dir).get_indexer(pd.Series(values, dtype=object)) >= 0
+
+def describe(system, values, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Vectorized code -> description lookup; unknown codes give NaN"""
+    return load_index(system, data_dir, cache_dir).reindex(pd.Series(values, dtype=object)).to_numpy()
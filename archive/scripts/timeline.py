@@ -0,0 +1,199 @@
+# timeline.py
+# Per-patient longitudinal timeline store.
+# Encounters, conditions, medications and observations of every patient are stored as
+# one event stream: each patient's events are contiguous and in time order, in plain
+# .npy column files under data/processed/timeline/ that are memory-mapped on open. A
+# sorted patient ID array with start offsets and lengths is the index, so fetching a
+# patient is a binary search and a slice, and fetching a cohort is one vectorized
+# gather. Only the pages holding the requested events are read from disk.
+# The store is built bucket by bucket from the patient-hash layout (partitions.py),
+# so only one bucket of each table is in memory during the build.
+
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import shutil
+from pathlib import Path
+from partitions import bucket_path, n_buckets, read_bucket
+import terminology
+
+# Configuration
+OUTPUT_DIR = Path('data/processed')
+TIMELINE_DIR = 'timeline'
+
+# Event kind -> source table, columns and code system; the kind's position is its code in KIND
+SOURCES = {
+    'encounter': {'table': 'clean_encounters', 'time': 'START', 'stop': 'STOP', 'value': None, 'system': 'snomed'},
+    'condition': {'table': 'clean_conditions', 'time': 'START', 'stop': 'STOP', 'value': None, 'system': 'snomed'},
+    'medication': {'table': 'clean_medications', 'time': 'START', 'stop': 'STOP', 'value': None, 'system': 'rxnorm'},
+    'observation': {'table': 'clean_observations', 'time': 'DATE', 'stop': None, 'value': 'VALUE_NUM',
+                    'system': 'loinc'},
+}
+KINDS = list(SOURCES)
+
+# Event column -> dtype; times are UTC nanoseconds (NaT as int64 min), CODE indexes codes.parquet
+EVENT_COLUMNS = {
+    'TIME': np.int64,
+    'STOP': np.int64,
+    'KIND': np.int8,
+    'CODE': np.int32,
+    'VALUE': np.float64,
+}
+
+NAT = np.iinfo(np.int64).min
+
+# Open stores, one per directory and process
+_STORES = {}
+
+def timeline_dir(output_dir=OUTPUT_DIR):
+    return Path(output_dir) / TIMELINE_DIR
+
+def _times(values):
+    return pd.DatetimeIndex(values).asi8 if len(values) else np.empty(0, dtype=np.int64)
+
+def bucket_events(bucket, code_ids, output_dir=OUTPUT_DIR):
+    """Events of one patient bucket as a frame; new (kind, code) pairs are added to code_ids in place"""
+    frames = []
+    for kind, source in SOURCES.items():
+        columns = ['PATIENT', source['time'], 'CODE']
+        columns += [c for c in (source['stop'], source['value']) if c is not None]
+        df = read_bucket(source['table'], bucket, columns=columns, output_dir=output_dir)
+        # Codes are factorized per bucket; only the distinct codes go through the dict
+        inverse, uniques = pd.factorize(df['CODE'].astype(str))
+        for code in uniques:
+            code_ids.setdefault((kind, code), len(code_ids))
+        bucket_codes = np.array([code_ids[(kind, code)] for code in uniques], dtype=np.int32)
+        frames.append(pd.DataFrame({
+            'PATIENT': df['PATIENT'].to_numpy(dtype=object),
+            'TIME': _times(df[source['time']]),
+            'STOP': _times(df[source['stop']]) if source['stop'] else NAT,
+            'KIND': np.int8(KINDS.index(kind)),
+            'CODE': bucket_codes[inverse] if len(df) else np.empty(0, dtype=np.int32),
+            'VALUE': df[source['value']].to_numpy(dtype=np.float64) if source['value'] else np.nan,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def build_timeline(output_dir=OUTPUT_DIR, data_dir=None):
+    """
+    Write the event columns, the patient index and the code table, with descriptions
+    from data_dir's dictionaries. Returns the event and patient counts. Needs the
+    patient-hash layout of the cleaned tables.
+    """
+    directory = timeline_dir(output_dir)
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    buckets = range(n_buckets(output_dir))
+    total = sum(pq.ParquetFile(bucket_path(s['table'], b, output_dir)).metadata.num_rows
+                for s in SOURCES.values() for b in buckets)
+    columns = {name: np.lib.format.open_memmap(directory / f'{name}.npy', mode='w+', dtype=dtype, shape=(total,))
+               for name, dtype in EVENT_COLUMNS.items()}
+
+    code_ids = {}
+    ids, starts, lengths, offset = [], [], [], 0
+    for bucket in buckets:
+        patients = pd.Index(read_bucket('clean_patients', bucket, columns=['id'], output_dir=output_dir)['id'])
+        events = bucket_events(bucket, code_ids, output_dir)
+        position = patients.get_indexer(events['PATIENT'])
+        order = np.lexsort((events['TIME'].to_numpy(), position))  # by patient, then time
+        for name in EVENT_COLUMNS:
+            columns[name][offset:offset + len(events)] = events[name].to_numpy()[order]
+        counts = np.bincount(position, minlength=len(patients))
+        ids.append(patients.to_numpy(dtype=object))
+        starts.append(offset + np.cumsum(counts) - counts)
+        lengths.append(counts)
+        offset += len(events)
+    for column in columns.values():
+        column.flush()
+
+    # Patient index sorted by ID for binary search
+    ids = np.concatenate(ids).astype(bytes)
+    order = np.argsort(ids, kind='stable')
+    np.save(directory / 'ids.npy', ids[order])
+    np.save(directory / 'start.npy', np.concatenate(starts)[order].astype(np.int64))
+    np.save(directory / 'length.npy', np.concatenate(lengths)[order].astype(np.int64))
+    codes = pd.DataFrame(list(code_ids), columns=['KIND', 'CODE'])  # row number is the code ID
+    codes['DESCRIPTION'] = None
+    for kind, source in SOURCES.items():
+        rows = codes['KIND'] == kind
+        codes.loc[rows, 'DESCRIPTION'] = terminology.describe(
+            source['system'], codes.loc[rows, 'CODE'], terminology.DATA_DIR if data_dir is None else data_dir,
+            terminology.index_cache_dir(output_dir))
+    codes.to_parquet(directory / 'codes.parquet')
+
+    counts = {'events': int(total), 'patients': len(ids)}
+    (directory / 'meta.json').write_text(json.dumps({**counts, 'kinds': KINDS}, indent=2))
+    return counts
+
+def open_timeline(output_dir=OUTPUT_DIR):
+    """Memory-mapped columns and index of the store, opened once per process"""
+    key = str(timeline_dir(output_dir).resolve())
+    if key not in _STORES:
+        directory = timeline_dir(output_dir)
+        store = {name: np.load(directory / f'{name}.npy', mmap_mode='r')
+                 for name in [*EVENT_COLUMNS, 'ids', 'start', 'length']}
+        store['codes'] = pd.read_parquet(directory / 'codes.parquet')
+        _STORES[key] = store
+    return _STORES[key]
+
+def _locate(store, patient_ids):
+    """Index positions of the given patient IDs; IDs not in the store are dropped"""
+    ids = store['ids']
+    wanted = pd.Series(patient_ids, dtype=object).dropna().astype(str).str.encode('utf-8')
+    # Casting to the stored fixed width would truncate longer IDs into false matches
+    wanted = wanted[wanted.str.len() <= ids.dtype.itemsize]
+    if len(ids) == 0 or len(wanted) == 0:
+        return np.array([], dtype=np.int64)
+    wanted = np.asarray(wanted, dtype=ids.dtype)
+    pos = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+    return pos[ids[pos] == wanted]
+
+def cohort_timelines(patient_ids, output_dir=OUTPUT_DIR):
+    """Full histories of the given patients, one block per patient in time order"""
+    store = open_timeline(output_dir)
+    pos = _locate(store, patient_ids)
+    start, length = store['start'][pos], store['length'][pos]
+
+    # Row numbers of every requested event: each patient's range, concatenated
+    first = np.cumsum(length) - length
+    rows = np.repeat(start - first, length) + np.arange(length.sum())
+    codes = store['codes']
+    code = store['CODE'][rows]
+    return pd.DataFrame({
+        'PATIENT': np.repeat(store['ids'][pos], length).astype(str),
+        'TIME': pd.to_datetime(store['TIME'][rows], utc=True),
+        'STOP': pd.to_datetime(store['STOP'][rows], utc=True),  # int64 min is NaT
+        'KIND': pd.Categorical.from_codes(store['KIND'][rows], KINDS),
+        'CODE': codes['CODE'].to_numpy()[code],
+        'DESCRIPTION': codes['DESCRIPTION'].to_numpy()[code],
+        'VALUE': store['VALUE'][rows],
+    })
+
+def patient_timeline(patient_id, output_dir=OUTPUT_DIR):
+    """Full history of one patient in time order"""
+    return cohort_timelines([patient_id], output_dir)
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: build the timeline store, return the report counts"""
+    return build_timeline(output_dir, data_dir)
+
+def report(counts):
+    print("### Timeline Store Report")
+    print(f"Events: {counts['events']:,}")
+    print(f"Patients: {counts['patients']:,}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show patient timelines from the timeline store")
+    parser.add_argument('patients', nargs='*', help="patient IDs")
+    parser.add_argument('--cohort', help="phenotype name (see cohorts.PHENOTYPES) instead of IDs")
+    args = parser.parse_args()
+
+    if args.cohort:
+        from cohorts import cohort
+        events = cohort_timelines(cohort(args.cohort).unique())
+        print(f"{events['PATIENT'].nunique():,} patients, {len(events):,} events")
+        print(events.groupby('KIND', observed=False).size().to_string())
+    for patient in args.patients:
+        print(f"\n=== {patient} ===")
+        print(patient_timeline(patient).to_string(index=False))
@@ -0,0 +1,77 @@
+# validation.py
+# Unit-aware range validation of observations.
+# Each rule gives a LOINC code's canonical unit, the plausible range in that unit and
+# the other units it may arrive in, with their linear conversion. Rules are flattened
+# into one (CODE, UNITS) lookup, so a chunk is checked with a single index probe and a
+# few columnar masks; there is no per-row Python. Accepted rows have VALUE_NUM and
+# UNITS converted to the canonical unit (VALUE keeps the exported text). Rejected
+# rows are returned separately with a REASON. Codes without a rule pass unchecked.
+
+import numpy as np
+import pandas as pd
+
+# Unit spellings (lowercased, as 03 stores them) -> (scale, offset) to the canonical unit
+MM_HG = {'mm[hg]': (1.0, 0.0), 'mmhg': (1.0, 0.0), 'kpa': (7.50062, 0.0)}
+PER_MIN = {'/min': (1.0, 0.0), '{beats}/min': (1.0, 0.0), '{breaths}/min': (1.0, 0.0)}
+
+RULES = {
+    '8480-6': {'unit': 'mm[hg]', 'range': (50, 300), 'units': MM_HG},     # Systolic BP
+    '8462-4': {'unit': 'mm[hg]', 'range': (20, 200), 'units': MM_HG},     # Diastolic BP
+    '39156-5': {'unit': 'kg/m2', 'range': (10, 100),                      # BMI
+                'units': {'kg/m2': (1.0, 0.0), 'kg/m^2': (1.0, 0.0)}},
+    '29463-7': {'unit': 'kg', 'range': (0.5, 650),                        # Body weight
+                'units': {'kg': (1.0, 0.0), 'g': (0.001, 0.0), '[lb_av]': (0.45359237, 0.0),
+                          'lb': (0.45359237, 0.0)}},
+    '8302-2': {'unit': 'cm', 'range': (20, 280),                          # Body height
+               'units': {'cm': (1.0, 0.0), 'm': (100.0, 0.0), '[in_i]': (2.54, 0.0), 'in': (2.54, 0.0)}},
+    '8867-4': {'unit': '/min', 'range': (20, 300), 'units': PER_MIN},     # Heart rate
+    '9279-1': {'unit': '/min', 'range': (4, 80), 'units': PER_MIN},       # Respiratory rate
+    '8310-5': {'unit': 'cel', 'range': (25, 45),                          # Body temperature
+               'units': {'cel': (1.0, 0.0), '[degf]': (5 / 9, -160 / 9)}},
+    '2708-6': {'unit': '%', 'range': (50, 100), 'units': {'%': (1.0, 0.0)}},       # Oxygen saturation
+    '2339-0': {'unit': 'mg/dl', 'range': (10, 2000),                      # Glucose
+               'units': {'mg/dl': (1.0, 0.0), 'mmol/l': (18.016, 0.0)}},
+}
+
+REASONS = ['non_numeric', 'unknown_unit', 'below_range', 'above_range']
+
+def rule_table(rules=RULES):
+    """One row per accepted (CODE, UNITS) pair with its conversion and range"""
+    rows = [(code, unit, scale, offset, rule['unit'], *rule['range'])
+            for code, rule in rules.items() for unit, (scale, offset) in rule['units'].items()]
+    return pd.DataFrame(rows, columns=['CODE', 'UNITS', 'SCALE', 'OFFSET', 'TO_UNITS', 'LOW', 'HIGH']
+                        ).set_index(['CODE', 'UNITS'])
+
+_RULE_TABLE = rule_table()
+
+def validate_ranges(obs, rules=RULES):
+    """
+    Split observations (with VALUE_NUM and lowercased UNITS) into accepted rows, in
+    canonical units, and quarantined rows, as they were, with a REASON column.
+    """
+    table = _RULE_TABLE if rules is RULES else rule_table(rules)
+    codes = obs['CODE'].to_numpy(dtype=object)
+    checked = np.flatnonzero(pd.Series(codes).isin(list(rules)).to_numpy())
+    units = obs['UNITS'].to_numpy(dtype=object)
+    pos = table.index.get_indexer(pd.MultiIndex.from_arrays([codes[checked], units[checked]]))
+    known = pos >= 0
+
+    # Unknown pairs take the first rule's numbers; their reason masks them below
+    take = lambda col: table[col].to_numpy()[np.where(known, pos, 0)]
+    raw = obs['VALUE_NUM'].to_numpy(dtype=np.float64)[checked]
+    converted = raw * take('SCALE') + take('OFFSET')
+    reason = np.select(
+        [np.isnan(raw), ~known, converted < take('LOW'), converted > take('HIGH')],
+        REASONS, default='',
+    )
+
+    value_num = obs['VALUE_NUM'].to_numpy(dtype=np.float64, copy=True)
+    value_num[checked] = converted
+    units = units.copy()
+    units[checked[known]] = take('TO_UNITS')[known]
+    rejected = np.zeros(len(obs), dtype=bool)
+    rejected[checked] = reason != ''
+
+    accepted = obs.assign(VALUE_NUM=value_num, UNITS=units)[~rejected]
+    quarantined = obs[rejected].assign(REASON=reason[reason != ''])
+    return accepted, quarantined
@@ -0,0 +1,89 @@
+# vitals.py
+# Wide vitals matrix shared by the BP/BMI analyses (07-09).
+# One row per (PATIENT, ENCOUNTER, DATE) with one column per vital, built from
+# clean_observations with a single sort-based reshape and persisted in the store.
+
+import pandas as pd
+from pathlib import Path
+from store import read_table, table_path, write_table
+from temporal import parse_timestamps
+
+OUTPUT_DIR = Path('data/processed')
+
+# LOINC code -> column name; add a vital here and re-run the stage
+VITALS = {
+    '8480-6': 'SYSTOLIC_BP',
+    '8462-4': 'DIASTOLIC_BP',
+    '39156-5': 'BMI',
+}
+
+KEYS = ['PATIENT', 'ENCOUNTER', 'DATE']
+
+# How far from a BP reading a BMI reading may be and still be paired with it
+BMI_TOLERANCE = '365D'
+
+def extract_vitals(observations, vitals=VITALS):
+    """Long observations (any subset of codes) -> wide vitals frame sorted by KEYS (patient, encounter, date)"""
+    long = observations.loc[observations['CODE'].isin(list(vitals)), KEYS + ['CODE', 'VALUE_NUM']]
+    long = long.assign(CODE=long['CODE'].astype(str).map(vitals),
+                       DATE=parse_timestamps(long['DATE'], 'datetime'))
+
+    # Sort once on the full key, then unstack the codes; duplicate readings are averaged
+    wide = (long.groupby(KEYS + ['CODE'], sort=True, observed=True)['VALUE_NUM'].mean()
+                .unstack('CODE')
+                .reindex(columns=list(vitals.values()))
+                .reset_index())
+    wide.columns.name = None
+    return wide
+
+def build_vitals(output_dir=OUTPUT_DIR, vitals=VITALS):
+    """Read only the vital rows and columns of clean_observations and reshape them"""
+    observations = pd.read_parquet(
+        table_path('clean_observations', output_dir),
+        columns=KEYS + ['CODE', 'VALUE_NUM'],
+        filters=[('CODE', 'in', list(vitals))],
+    )
+    return extract_vitals(observations, vitals)
+
+def load_vitals(columns=None, patients=None, output_dir=OUTPUT_DIR):
+    """Load the persisted vitals table, optionally only some columns or patients"""
+    path = table_path('vitals', output_dir)
+    source = table_path('clean_observations', output_dir)
+    if not path.exists() or source.stat().st_mtime_ns > path.stat().st_mtime_ns:
+        write_table(build_vitals(output_dir), 'vitals', output_dir)
+    if patients is None:
+        return read_table('vitals', columns=columns, output_dir=output_dir)
+    # Rows are sorted by KEYS, PATIENT first, so row-group statistics skip most of the file
+    return pd.read_parquet(path, columns=columns, filters=[('PATIENT', 'in', list(patients))])
+
+def align_vitals(wide, tolerance=BMI_TOLERANCE):
+    """
+    One row per BP reading: systolic and diastolic from the same encounter, plus the
+    patient's BMI nearest in time within `tolerance` (NaN if none). Output is linear in
+    the number of BP readings, unlike a join on PATIENT alone.
+    """
+    bp = wide.dropna(subset=['SYSTOLIC_BP', 'DIASTOLIC_BP'])[['PATIENT', 'ENCOUNTER', 'DATE', 'SYSTOLIC_BP', 'DIASTOLIC_BP']]
+    bmi = wide.dropna(subset=['BMI'])[['PATIENT', 'DATE', 'BMI']]
+    return pd.merge_asof(
+        bp.dropna(subset=['DATE']).sort_values('DATE'),
+        bmi.dropna(subset=['DATE']).sort_values('DATE'),
+        on='DATE', by='PATIENT', direction='nearest', tolerance=pd.Timedelta(tolerance),
+    )
+
+def run_stage(data_dir=None, output_dir=OUTPUT_DIR):
+    """Pipeline stage: build and persist the vitals table, return the report counts"""
+    wide = build_vitals(output_dir)
+    write_table(wide, 'vitals', output_dir)
+    counts = {'rows': len(wide), 'patients': wide['PATIENT'].nunique()}
+    counts.update({col: int(wide[col].notna().sum()) for col in VITALS.values()})
+    return counts
+
+def report(counts):
+    print("### Vitals Matrix Report")
+    print(f"Rows (patient, encounter, time): {counts['rows']:,}")
+    print(f"Patients: {counts['patients']:,}")
+    for col in VITALS.values():
+        print(f"{col} readings: {counts.get(col, 0):,}")
+
+if __name__ == "__main__":
+    report(run_stage())
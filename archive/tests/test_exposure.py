@@ -0,0 +1,74 @@
+# test_exposure.py
+# Treated/untreated flags from the medication exposure intervals: a reading is exposed
+# when it falls in [START, STOP) of one of its patient's merged courses.
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def exposure(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import exposure
+    return exposure
+
+def ts(value):
+    return pd.Timestamp(value, tz='UTC') if value is not None else pd.NaT
+
+def courses(*rows):
+    """(patient, start, stop) rows of one drug class; stop None is an ongoing course"""
+    return pd.DataFrame({
+        'PATIENT': [r[0] for r in rows],
+        'START': pd.Series([ts(r[1]) for r in rows], dtype='datetime64[ns, UTC]'),
+        'STOP': pd.Series([ts(r[2]) for r in rows], dtype='datetime64[ns, UTC]'),
+        'CODE': '314076',
+        'CLASS': 'antihypertensive',
+    })
+
+def readings(*rows):
+    """(patient, date) BP readings"""
+    return pd.DataFrame({'PATIENT': [r[0] for r in rows],
+                         'DATE': pd.Series([ts(r[1]) for r in rows], dtype='datetime64[ns, UTC]')})
+
+def flags(exposure, course_rows, reading_rows):
+    intervals = exposure.merge_intervals(courses(*course_rows))
+    return exposure.exposed_at(readings(*reading_rows), intervals).tolist()
+
+def test_reading_inside_an_interval(exposure):
+    assert flags(exposure, [('a', '2020-01-01', '2020-03-01')],
+                 [('a', '2020-01-01'), ('a', '2020-02-01')]) == [True, True]
+
+def test_reading_at_or_after_stop(exposure):
+    assert flags(exposure, [('a', '2020-01-01', '2020-03-01')],
+                 [('a', '2020-03-01'), ('a', '2020-06-01'), ('a', '2019-12-31')]) == [False, False, False]
+
+def test_open_ended_stop(exposure):
+    intervals = exposure.merge_intervals(courses(('a', '2020-01-01', None)))
+    assert intervals['STOP'].isna().all()
+    assert exposure.exposed_at(readings(('a', '2019-06-01'), ('a', '2030-01-01')), intervals).tolist() == [False, True]
+
+def test_overlapping_courses_merge(exposure):
+    rows = [('a', '2020-01-01', '2020-03-01'), ('a', '2020-02-01', '2020-05-01'), ('a', '2020-08-01', '2020-09-01')]
+    intervals = exposure.merge_intervals(courses(*rows))
+    assert intervals[['START', 'STOP', 'COURSES']].values.tolist() == [
+        [ts('2020-01-01'), ts('2020-05-01'), 2],
+        [ts('2020-08-01'), ts('2020-09-01'), 1],
+    ]
+    # Inside the second course after the first has stopped, and in the gap between intervals
+    assert flags(exposure, rows, [('a', '2020-04-01'), ('a', '2020-06-01')]) == [True, False]
+
+def test_patient_without_prescriptions(exposure):
+    assert flags(exposure, [('a', '2020-01-01', '2020-03-01')],
+                 [('b', '2020-02-01'), ('a', '2020-02-01')]) == [False, True]
+
+def test_exposed_during_windows(exposure):
+    intervals = exposure.merge_intervals(courses(('a', '2020-01-01', '2020-03-01')))
+    events = pd.DataFrame({
+        'PATIENT': ['a', 'a', 'a'],
+        'START': pd.Series([ts('2019-12-01'), ts('2020-03-01'), ts('2019-01-01')], dtype='datetime64[ns, UTC]'),
+        'STOP': pd.Series([ts('2020-01-02'), ts('2020-04-01'), pd.NaT], dtype='datetime64[ns, UTC]'),
+    })
+    assert exposure.exposed_during(events, intervals).tolist() == [True, False, True]
@@ -0,0 +1,46 @@
+# test_pipeline.py
+# Stage fingerprints must cover every module a stage's output depends on: a change to
+# the observation rules in validation.py re-runs observations and what derives from it.
+
+import shutil
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def run_pipeline(monkeypatch, tmp_path):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import run_pipeline
+    scripts = tmp_path / 'scripts'
+    shutil.copytree(SCRIPT_DIR, scripts, ignore=shutil.ignore_patterns('__pycache__'))
+    monkeypatch.setattr(run_pipeline, 'SCRIPT_DIR', scripts)
+    return run_pipeline
+
+def fingerprints(run_pipeline):
+    """Fingerprint of every stage for fixed input digests"""
+    stages = run_pipeline.STAGES
+    result = {}
+    for name in TopologicalSorter({n: s['depends'] for n, s in stages.items()}).static_order():
+        digests = {i: f'digest-of-{i}' for i in stages[name]['inputs']}
+        result[name] = run_pipeline.stage_fingerprint(name, result, digests)
+    return result
+
+def test_rule_change_invalidates_observations(run_pipeline):
+    before = fingerprints(run_pipeline)
+    validation = run_pipeline.SCRIPT_DIR / 'validation.py'
+    validation.write_text(validation.read_text() + "\nRULES = dict(RULES)  # edited rule set\n")
+    after = fingerprints(run_pipeline)
+
+    changed = {name for name in before if before[name] != after[name]}
+    assert {'observations', 'vitals', 'densities', 'profile', 'partitions', 'timeline'} <= changed
+    assert not changed & {'patients', 'conditions', 'medications', 'encounters', 'exposures'}
+
+def test_rule_change_invalidates_incremental_blocks(run_pipeline):
+    digests = {i: f'digest-of-{i}' for i in run_pipeline.STAGES['observations']['inputs']}
+    before = run_pipeline.stage_context('observations', digests)
+    validation = run_pipeline.SCRIPT_DIR / 'validation.py'
+    validation.write_text(validation.read_text() + "\n# edited\n")
+    assert run_pipeline.stage_context('observations', digests) != before
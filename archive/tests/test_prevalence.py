@@ -0,0 +1,62 @@
+# test_prevalence.py
+# Direct age standardisation on known stratum counts and weights, and the bootstrap
+# interval around it.
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def prevalence(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import prevalence
+    return prevalence
+
+def cohort():
+    """10 patients aged 22 (2 cases) and 20 aged 62 (10 cases); women only in the older band"""
+    ages = [22] * 10 + [62] * 20
+    cases = [i < 2 for i in range(10)] + [i % 2 == 0 for i in range(20)]
+    patients = pd.DataFrame({
+        'id': [f'p{i}' for i in range(30)],
+        'age': ages,
+        'gender': ['M'] * 10 + ['F'] * 10 + ['M'] * 10,
+    })
+    return patients, patients.loc[cases, 'id']
+
+# Standard population weighting the 60-64 band three times the 20-24 band
+WEIGHTS = pd.Series({'20-24': 1.0, '60-64': 3.0})
+
+def test_stratum_counts(prevalence):
+    patients, cases = cohort()
+    n, k = prevalence.stratum_counts(patients, cases)
+    assert n.loc['all', '20-24'] == 10 and n.loc['all', '60-64'] == 20
+    assert k.loc['all', '20-24'] == 2 and k.loc['all', '60-64'] == 10
+    assert n.to_numpy().sum() == 30
+
+def test_standardized_rate(prevalence):
+    patients, cases = cohort()
+    result = prevalence.age_standardized_prevalence(patients, cases, standard=WEIGHTS, n_boot=0)
+    row = result.iloc[0]
+    assert row['crude'] == pytest.approx(12 / 30)
+    assert row['standardized'] == pytest.approx((0.2 * 1 + 0.5 * 3) / 4)
+
+def test_groups_reweight_over_their_own_bands(prevalence):
+    patients, cases = cohort()
+    result = prevalence.age_standardized_prevalence(patients, cases, by=('gender',), standard=WEIGHTS,
+                                                    n_boot=0).set_index('gender')
+    # Women are only in 60-64, where 5 of 10 are cases; men have 2/10 and 5/10
+    assert result.loc['F', 'standardized'] == pytest.approx(0.5)
+    assert result.loc['M', 'standardized'] == pytest.approx((0.2 * 1 + 0.5 * 3) / 4)
+
+def test_bootstrap_interval(prevalence):
+    patients, cases = cohort()
+    run = lambda: prevalence.age_standardized_prevalence(patients, cases, standard=WEIGHTS,
+                                                         n_boot=500, workers=1, seed=7)
+    first, second = run(), run()
+    pd.testing.assert_frame_equal(first, second)
+    row = first.iloc[0]
+    assert row['ci_low'] < row['standardized'] < row['ci_high']
+    assert 0 <= row['ci_low'] and row['ci_high'] <= 1
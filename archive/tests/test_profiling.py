@@ -0,0 +1,43 @@
+# test_profiling.py
+# A table with no rows (e.g. quarantined_observations of a clean export) must profile
+# as empty rather than fail, and batching must not change the profile.
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def modules(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import profiling
+    import store
+    return profiling, store
+
+def frame(n):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'PATIENT': [f'patient-{i % 7}' for i in range(n)],
+        'DATE': pd.date_range('2020-01-01', periods=n, freq='D', tz='UTC'),
+        'VALUE_NUM': rng.normal(120, 15, n),
+        'UNITS': 'mm[Hg]',
+    })
+
+def test_empty_table(modules, tmp_path):
+    profiling, store = modules
+    path = store.write_table(frame(0), 'empty', tmp_path)
+    summary = profiling.summarize(profiling.profile_file(path))
+    assert set(summary) == {'PATIENT', 'DATE', 'VALUE_NUM', 'UNITS'}
+    assert all(s['count'] == 0 and s['distinct'] == 0 for s in summary.values())
+
+def test_batches_merge_exactly(modules, tmp_path):
+    profiling, store = modules
+    path = store.write_table(frame(500), 'readings', tmp_path)
+    whole = profiling.summarize(profiling.profile_file(path, batch_rows=1000))
+    batched = profiling.summarize(profiling.profile_file(path, batch_rows=64))
+    for key in ['mean', 'std']:  # sums in a different order
+        assert batched['VALUE_NUM'].pop(key) == pytest.approx(whole['VALUE_NUM'].pop(key))
+    assert batched == whole
@@ -0,0 +1,37 @@
+# test_query.py
+# SQL views over the store follow the tables on disk: a table written after the first
+# query is visible to the next one, and paths with quotes in them still work.
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def modules(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import query
+    import store
+    monkeypatch.setattr(query, '_CONNECTIONS', {})
+    return query, store
+
+def test_tables_written_later_are_visible(modules, tmp_path):
+    query, store = modules
+    output_dir = tmp_path / "it's here"
+    output_dir.mkdir()
+    store.write_table(pd.DataFrame({'id': ['a', 'b']}), 'clean_patients', output_dir)
+    assert query.sql("SELECT count(*) AS n FROM patients", output_dir=output_dir)['n'][0] == 2
+
+    store.write_table(pd.DataFrame({'PATIENT': ['a'], 'CODE': ['123']}), 'clean_conditions', output_dir)
+    assert query.sql("SELECT CODE FROM conditions", output_dir=output_dir)['CODE'].tolist() == ['123']
+    names = query.tables(output_dir)['table_name'].tolist()
+    assert {'clean_patients', 'patients', 'clean_conditions', 'conditions'} <= set(names)
+
+def test_removed_tables_are_dropped(modules, tmp_path):
+    query, store = modules
+    path = store.write_table(pd.DataFrame({'id': ['a']}), 'clean_patients', tmp_path)
+    assert 'patients' in query.tables(tmp_path)['table_name'].tolist()
+    path.unlink()
+    assert 'patients' not in query.tables(tmp_path)['table_name'].tolist()
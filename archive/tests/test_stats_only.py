@@ -0,0 +1,71 @@
+# test_stats_only.py
+# A stats-only run (--plots none) of the analysis scripts 07-09 must not compute any
+# KDE, even when the densities table is missing and would otherwise be rebuilt.
+
+import runpy
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+SCRIPTS = [
+    '07_hypertension_bp_bmi_analysis',
+    '08_compare_bp_bmi_hypertensive_vs_non',
+    '09_hypertension_prevalence',
+]
+
+def write_store(output_dir, n_patients=40, readings=5):
+    """Minimal processed store: the tables 07-09 read, derived tables newer than their sources"""
+    from store import write_table
+    rng = np.random.default_rng(0)
+    ids = [f'patient-{i:03d}' for i in range(n_patients)]
+    dates = pd.date_range('2020-01-01', periods=readings, freq='30D', tz='UTC')
+
+    # Sources first, so the derived tables are not rebuilt from them
+    write_table(pd.DataFrame({'PATIENT': ids, 'START': dates[0], 'CODE': '59621000'}), 'clean_conditions', output_dir)
+    write_table(pd.DataFrame({'PATIENT': ids, 'CODE': '8480-6', 'VALUE_NUM': 120.0}), 'clean_observations', output_dir)
+    write_table(pd.DataFrame({'PATIENT': ids, 'CODE': '314076', 'START': dates[0], 'STOP': dates[-1]}),
+                'clean_medications', output_dir)
+
+    write_table(pd.DataFrame({
+        'id': ids,
+        'age': rng.integers(20, 90, n_patients).astype(float),
+        'gender': rng.choice(['F', 'M'], n_patients),
+        'race': rng.choice(['white', 'black'], n_patients),
+    }), 'clean_patients', output_dir)
+    hypertensive = np.arange(n_patients) % 2 == 0
+    write_table(pd.DataFrame({'PATIENT': ids, 'hypertension': hypertensive,
+                              'hypertension_onset': pd.Series(dates[0], index=range(n_patients)).where(hypertensive)}),
+                'phenotypes', output_dir)
+    rows = n_patients * readings
+    write_table(pd.DataFrame({
+        'PATIENT': np.repeat(ids, readings),
+        'ENCOUNTER': [f'encounter-{i}' for i in range(rows)],
+        'DATE': np.tile(dates, n_patients),
+        'SYSTOLIC_BP': rng.normal(125, 15, rows),
+        'DIASTOLIC_BP': rng.normal(80, 10, rows),
+        'BMI': rng.normal(27, 4, rows),
+    }), 'vitals', output_dir)
+    exposures = pd.DataFrame({'PATIENT': ids[::3], 'CLASS': 'antihypertensive', 'START': dates[1], 'COURSES': 1})
+    exposures.insert(3, 'STOP', pd.Series(pd.NaT, index=exposures.index, dtype='datetime64[ns, UTC]'))
+    write_table(exposures, 'exposures', output_dir)
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_stats_only_run_computes_no_kde(script, tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    monkeypatch.chdir(tmp_path)
+    output_dir = tmp_path / 'data' / 'processed'
+    output_dir.mkdir(parents=True)
+    write_store(output_dir)
+
+    import density
+    calls = []
+    monkeypatch.setattr(density, 'fft_kde', lambda *args, **kwargs: calls.append(args))
+    monkeypatch.setattr(sys, 'argv', [f'{script}.py', '--plots', 'none'])
+    runpy.run_path(str(SCRIPT_DIR / f'{script}.py'), run_name='__main__')
+
+    assert calls == []
+    assert not (output_dir / 'densities.parquet').exists()
@@ -0,0 +1,39 @@
+# test_telemetry.py
+# Telemetry and the benchmarks must import and record where the resource module does
+# not exist (Windows); peak RSS is then reported as None.
+
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def without_resource(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    monkeypatch.setitem(sys.modules, 'resource', None)  # import resource raises ImportError
+    for name in ['telemetry', 'benchmark_pipeline', 'benchmark_store']:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    yield
+    for name in ['telemetry', 'benchmark_pipeline', 'benchmark_store']:
+        sys.modules.pop(name, None)
+
+def test_peak_rss_is_none_without_resource(without_resource, monkeypatch):
+    telemetry = importlib.import_module('telemetry')
+    benchmark_pipeline = importlib.import_module('benchmark_pipeline')
+    importlib.import_module('benchmark_store')
+    assert telemetry.peak_rss_mb() is None
+    assert benchmark_pipeline._peak_rss_mb(children=True) is None
+
+    # Neither /proc nor resource: the steps are still recorded, without a memory delta
+    monkeypatch.setattr(telemetry, 'rss_mb', lambda: None)
+    monkeypatch.setattr(telemetry, 'RECORDS', [])
+    with telemetry.stage('clean'):
+        with telemetry.step('load') as s:
+            s['rows_out'] = 3
+    record, = telemetry.RECORDS
+    assert record['peak_rss_mb'] is None
+    assert record['steps'][0]['rows_out'] == 3
+    assert record['steps'][0]['rss_delta_mb'] is None
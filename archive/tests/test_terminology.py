@@ -0,0 +1,38 @@
+# test_terminology.py
+# Codes are validated against the dictionary of the data directory a stage runs on,
+# even when another directory's dictionary was loaded earlier in the same process.
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def terminology(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import terminology
+    monkeypatch.setattr(terminology, '_INDEXES', {})
+    return terminology
+
+def write_dictionary(data_dir, codes):
+    data_dir.mkdir(parents=True)
+    pd.DataFrame({'CODE': codes, 'DESCRIPTION': [f'term {c}' for c in codes]}).to_csv(
+        data_dir / 'dictionary_snomed.csv', index=False)
+    return data_dir
+
+def test_lookups_follow_the_data_dir(terminology, tmp_path):
+    first = write_dictionary(tmp_path / 'first', ['111', '222'])
+    second = write_dictionary(tmp_path / 'second', ['222', '333'])
+    cache_dir = terminology.index_cache_dir(tmp_path / 'processed')
+    values = ['111', '222', '333']
+
+    assert terminology.is_valid('snomed', values, first, cache_dir).tolist() == [True, True, False]
+    assert terminology.is_valid('snomed', values, second, cache_dir).tolist() == [False, True, True]
+    assert len(list(cache_dir.glob('terminology_snomed_*.parquet'))) == 2
+
+    # A fresh process reads each directory's lookup back from its own disk cache
+    terminology._INDEXES.clear()
+    assert terminology.describe('snomed', ['111', '333'], second, cache_dir)[1] == 'term 333'
+    assert pd.isna(terminology.describe('snomed', ['111', '333'], second, cache_dir)[0])
@@ -0,0 +1,32 @@
+# test_timeline.py
+# Patient lookup in the timeline index: stored IDs are fixed-width bytes, and a longer
+# wanted ID must not be truncated into a match; an empty store matches nothing.
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def timeline(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import timeline
+    return timeline
+
+def store(*ids):
+    return {'ids': np.sort(np.array(ids, dtype=object).astype(bytes))}
+
+def test_locate_exact_ids(timeline):
+    index = store('abc', 'abd', 'xyz')
+    assert timeline._locate(index, ['xyz', 'abc', 'missing', None]).tolist() == [2, 0]
+
+def test_longer_id_does_not_match_its_prefix(timeline):
+    index = store('abc', 'abd')
+    assert timeline._locate(index, ['abcd', 'abd-1']).tolist() == []
+
+def test_empty_store(timeline):
+    index = {'ids': np.array([], dtype='S36')}
+    assert timeline._locate(index, ['abc']).tolist() == []
+    assert timeline._locate(store('abc'), []).tolist() == []
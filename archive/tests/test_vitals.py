@@ -0,0 +1,44 @@
+# test_vitals.py
+# align_vitals pairs each BP reading with the same patient's nearest BMI, but only
+# within the tolerance; further away the BMI is NaN.
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+
+@pytest.fixture
+def vitals(monkeypatch):
+    monkeypatch.syspath_prepend(str(SCRIPT_DIR))
+    import vitals
+    return vitals
+
+def wide(rows):
+    """(patient, encounter, date, systolic, diastolic, bmi) rows of the vitals table"""
+    frame = pd.DataFrame(rows, columns=['PATIENT', 'ENCOUNTER', 'DATE', 'SYSTOLIC_BP', 'DIASTOLIC_BP', 'BMI'])
+    return frame.assign(DATE=pd.to_datetime(frame['DATE'], utc=True))
+
+def test_bmi_within_and_beyond_tolerance(vitals):
+    table = wide([
+        ('inside', 'e1', '2020-01-01', 130.0, 85.0, np.nan),
+        ('inside', 'e2', '2020-12-30', np.nan, np.nan, 27.5),    # 364 days later
+        ('outside', 'e3', '2020-01-01', 140.0, 90.0, np.nan),
+        ('outside', 'e4', '2021-01-02', np.nan, np.nan, 31.0),   # 367 days later
+    ])
+    aligned = vitals.align_vitals(table, tolerance='365D').set_index('PATIENT')
+    assert aligned.loc['inside', 'BMI'] == 27.5
+    assert np.isnan(aligned.loc['outside', 'BMI'])
+    assert aligned.loc['outside', 'SYSTOLIC_BP'] == 140.0
+
+def test_nearest_bmi_of_the_same_patient(vitals):
+    table = wide([
+        ('a', 'e1', '2020-06-01', 120.0, 80.0, np.nan),
+        ('a', 'e2', '2020-01-01', np.nan, np.nan, 20.0),
+        ('a', 'e3', '2020-07-01', np.nan, np.nan, 22.0),   # nearer
+        ('b', 'e4', '2020-06-01', np.nan, np.nan, 35.0),   # same day, other patient
+    ])
+    aligned = vitals.align_vitals(table)
+    assert aligned['BMI'].tolist() == [22.0]